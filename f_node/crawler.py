@@ -5,6 +5,8 @@ FOFA爬虫 - 高级反反爬版
 """
 
 import requests
+import argparse
+import glob
 import json
 import os
 import sys
@@ -25,6 +27,36 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 提取数据用的正则，模块加载时编译一次
+HOST_PATTERN = re.compile(r'<span class="hsxa-host"[^>]*>\s*<a[^>]*href="[^"]*"[^>]*>([^<]+)</a>')
+CLIPBOARD_PATTERN = re.compile(r'data-clipboard-text="([^"]+:\d+)"')
+IP_LINK_PATTERN = re.compile(r'<a[^>]*class="hsxa-jump-a"[^>]*href="[^"]*qbase64=aXA=[^"]*"[^>]*>([^<]+)</a>')
+PORT_LINK_PATTERN = re.compile(r'<a[^>]*class="hsxa-port"[^>]*href="[^"]*qbase64=cG9ydD=[^"]*"[^>]*>([^<]+)</a>')
+# 只匹配ASCII数字：Unicode数字组成的地址通不过is_valid_ip，还会吞掉其后的有效地址
+IP_PORT_PATTERN = re.compile(r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d{1,5})', re.ASCII)
+PORT_DIGITS_PATTERN = re.compile(r'(\d{1,5})')
+VALID_IP_PATTERN = re.compile(r'^\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b$')
+
+# 合并扫描：匹配IP/端口链接和clipboard的起始位置，以及IP:端口本身
+# 开头的字符集让正则引擎直接跳过不可能匹配的字符，再按消耗的首字符分派；
+# 起始锚点都不含数字，不会吞掉其中的IP:端口。与IP_PORT_PATTERN一样只匹配ASCII数字，
+# 因此IP:端口的匹配结果与单独findall相同
+SCAN_PATTERN = re.compile(
+    r'[<d0-9]'
+    r'(?:(?<=<)(a)(?=[^>]*class="hsxa-(?:jump-a|port)")'
+    r'|(?<=d)(ata-clipboard-text=")'
+    r'|(?<=[0-9])(\d{0,2}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d{1,5}))',
+    re.ASCII
+)
+
+# 提取方法的优先顺序，合并扫描的结果也按方法名归类
+EXTRACTION_METHODS = (
+    'extract_via_host_pattern',
+    'extract_via_clipboard',
+    'extract_via_ip_port_links',
+    'extract_via_regex'
+)
+
 class AdvancedFOFACrawler:
     def __init__(self, config_file="config.json"):
         """初始化高级爬虫"""
@@ -390,25 +422,40 @@ class AdvancedFOFACrawler:
             f.write(html_content)
         logger.info(f"  响应已保存到: {debug_file}")
         
-        # 多种提取方法
-        extraction_methods = [
-            self.extract_via_host_pattern,
-            self.extract_via_clipboard,
-            self.extract_via_ip_port_links,
-            self.extract_via_regex
-        ]
+        # host模式单独扫描，其余方法合并为一次扫描，按方法归类后合并
+        max_results = self.config.get('settings', {}).get('max_results', 10)
+        found = self.extract_single_pass(html_content, max_results)
+        unique_pairs = self.collect_pairs(found.items(), max_results)
         
+        # 显示结果
+        if unique_pairs:
+            logger.info(f"\n  数据预览:")
+            for i, pair in enumerate(unique_pairs):
+                logger.info(f"    {i+1:2d}. IP: {pair[0]:15s} 端口: {pair[1]}")
+        else:
+            logger.warning("  ⚠️  未提取到任何数据")
+            # 尝试从保存的文件中分析
+            self.analyze_html_structure(html_content)
+        
+        return unique_pairs
+    
+    def collect_pairs(self, results, max_results, verbose=True):
+        """按方法顺序合并各方法的结果
+        
+        results 为 (方法名, 结果) 序列；累计结果数达到max_results后不再使用后面的方法，
+        去重时保留首次出现的顺序，最后截断为max_results条
+        """
         all_pairs = []
         
-        for method in extraction_methods:
-            pairs = method(html_content)
+        for name, pairs in results:
             if pairs:
-                logger.info(f"  方法 {method.__name__} 找到 {len(pairs)} 条数据")
+                if verbose:
+                    logger.info(f"  方法 {name} 找到 {len(pairs)} 条数据")
                 all_pairs.extend(pairs)
-                if len(all_pairs) >= self.config.get('settings', {}).get('max_results', 10):
+                if len(all_pairs) >= max_results:
                     break
-            else:
-                logger.info(f"  方法 {method.__name__} 未找到数据")
+            elif verbose:
+                logger.info(f"  方法 {name} 未找到数据")
         
         # 去重
         unique_pairs = []
@@ -420,30 +467,73 @@ class AdvancedFOFACrawler:
                 seen.add(key)
                 unique_pairs.append(pair)
         
-        logger.info(f"  总共找到 {len(all_pairs)} 个IP端口对，去重后 {len(unique_pairs)} 个")
+        if verbose:
+            logger.info(f"  总共找到 {len(all_pairs)} 个IP端口对，去重后 {len(unique_pairs)} 个")
         
         # 限制最大结果数量
-        max_results = self.config.get('settings', {}).get('max_results', 10)
         if len(unique_pairs) > max_results:
             unique_pairs = unique_pairs[:max_results]
-            logger.info(f"  限制为前 {max_results} 条结果")
-        
-        # 显示结果
-        if unique_pairs:
-            logger.info(f"\n  数据预览:")
-            for i, pair in enumerate(unique_pairs):
-                logger.info(f"    {i+1:2d}. IP: {pair[0]:15s} 端口: {pair[1]}")
-        else:
-            logger.warning("  ⚠️  未提取到任何数据")
-            # 尝试从保存的文件中分析
-            self.analyze_html_structure(html_content)
+            if verbose:
+                logger.info(f"  限制为前 {max_results} 条结果")
         
         return unique_pairs
     
+    def extract_single_pass(self, html_content, max_results=None):
+        """最多两次扫描HTML，返回 {方法名: 结果}，合并后与逐个调用四个提取方法相同
+        
+        host模式单独扫描一次：它以整段字面量开头，正则引擎查找最快，且优先级最高，
+        单独找到max_results条时后面的方法不会被用到，直接返回；
+        否则其余三个方法合并为一次扫描（SCAN_PATTERN）
+        """
+        found = {name: [] for name in EXTRACTION_METHODS}
+        found['extract_via_host_pattern'] = self.extract_via_host_pattern(html_content)
+        if max_results and len(found['extract_via_host_pattern']) >= max_results:
+            return found
+        
+        ip_links = []
+        port_links = []
+        # 各模式上一次匹配的结束位置，保持findall的不重叠语义
+        clipboard_end = ip_end = port_end = 0
+        
+        for scan in SCAN_PATTERN.finditer(html_content):
+            kind = scan.lastindex
+            start = scan.start()
+            if kind == 1:
+                if start >= ip_end:
+                    match = IP_LINK_PATTERN.match(html_content, start)
+                    if match:
+                        ip_end = match.end()
+                        ip_links.append(match.group(1))
+                if start >= port_end:
+                    match = PORT_LINK_PATTERN.match(html_content, start)
+                    if match:
+                        port_end = match.end()
+                        port_links.append(match.group(1))
+            elif kind == 2:
+                if start < clipboard_end:
+                    continue
+                match = CLIPBOARD_PATTERN.match(html_content, start)
+                if match:
+                    clipboard_end = match.end()
+                    ip, port = match.group(1).split(':', 1)
+                    if self.is_valid_ip(ip):
+                        found['extract_via_clipboard'].append([ip, port])
+            else:
+                ip = html_content[start:scan.end(3)]
+                if self.is_valid_ip(ip):
+                    found['extract_via_regex'].append([ip, scan.group(4)])
+        
+        found['extract_via_ip_port_links'] = self.pair_ip_port_links(ip_links, port_links)
+        return found
+    
+    def extract_multi_pass(self, html_content):
+        """逐个方法扫描整个HTML，按需执行，仅用于基准对比"""
+        for name in EXTRACTION_METHODS:
+            yield name, getattr(self, name)(html_content)
+    
     def extract_via_host_pattern(self, html_content):
         """通过host模式提取"""
-        pattern = r'<span class="hsxa-host"[^>]*>\s*<a[^>]*href="[^"]*"[^>]*>([^<]+)</a>'
-        matches = re.findall(pattern, html_content)
+        matches = HOST_PATTERN.findall(html_content)
         
         pairs = []
         for match in matches:
@@ -457,8 +547,7 @@ class AdvancedFOFACrawler:
     
     def extract_via_clipboard(self, html_content):
         """通过clipboard数据提取"""
-        pattern = r'data-clipboard-text="([^"]+:\d+)"'
-        matches = re.findall(pattern, html_content)
+        matches = CLIPBOARD_PATTERN.findall(html_content)
         
         pairs = []
         for match in matches:
@@ -472,13 +561,15 @@ class AdvancedFOFACrawler:
     def extract_via_ip_port_links(self, html_content):
         """通过独立的IP和端口链接提取"""
         # 提取IP
-        ip_pattern = r'<a[^>]*class="hsxa-jump-a"[^>]*href="[^"]*qbase64=aXA=[^"]*"[^>]*>([^<]+)</a>'
-        ip_matches = re.findall(ip_pattern, html_content)
+        ip_matches = IP_LINK_PATTERN.findall(html_content)
         
         # 提取端口
-        port_pattern = r'<a[^>]*class="hsxa-port"[^>]*href="[^"]*qbase64=cG9ydD=[^"]*"[^>]*>([^<]+)</a>'
-        port_matches = re.findall(port_pattern, html_content)
+        port_matches = PORT_LINK_PATTERN.findall(html_content)
         
+        return self.pair_ip_port_links(ip_matches, port_matches)
+    
+    def pair_ip_port_links(self, ip_matches, port_matches):
+        """按出现顺序配对IP链接和端口链接"""
         pairs = []
         min_count = min(len(ip_matches), len(port_matches))
         for i in range(min_count):
@@ -487,7 +578,7 @@ class AdvancedFOFACrawler:
             
             if self.is_valid_ip(ip):
                 if not port.isdigit():
-                    port_match = re.search(r'(\d{1,5})', port)
+                    port_match = PORT_DIGITS_PATTERN.search(port)
                     port = port_match.group(1) if port_match else "443"
                 
                 pairs.append([ip, port])
@@ -497,8 +588,7 @@ class AdvancedFOFACrawler:
     def extract_via_regex(self, html_content):
         """通过正则表达式提取"""
         # 匹配IP:端口格式
-        pattern = r'(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}):(\d{1,5})'
-        matches = re.findall(pattern, html_content)
+        matches = IP_PORT_PATTERN.findall(html_content)
         
         pairs = []
         for ip, port in matches:
@@ -529,8 +619,7 @@ class AdvancedFOFACrawler:
     def is_valid_ip(self, ip_str):
         """验证IP地址"""
         # 简化的IP验证
-        pattern = r'^\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b$'
-        if not re.match(pattern, ip_str):
+        if not VALID_IP_PATTERN.match(ip_str):
             return False
         
         parts = ip_str.split('.')
@@ -631,8 +720,58 @@ class AdvancedFOFACrawler:
             logger.info("  4. 更换User-Agent")
             return False
 
+def benchmark_extraction(paths, rounds=20, config_file="config.json"):
+    """在保存的响应页面上对比合并扫描与逐个方法扫描的耗时，并检查两者结果一致"""
+    crawler = AdvancedFOFACrawler(config_file)
+    max_results = crawler.config.get('settings', {}).get('max_results', 10)
+    # 不限数量时，逐个方法扫描必须跑完四遍，用于对比完整提取的开销
+    limits = [max_results, sys.maxsize]
+    
+    pages = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            pages.append((path, f.read()))
+    total_bytes = sum(len(html.encode('utf-8')) for _, html in pages)
+    logger.info(f"基准测试: {len(pages)} 个页面，共 {total_bytes / 1024:.1f} KB，每种方式重复 {rounds} 次")
+    
+    for limit in limits:
+        label = f"max_results={limit}" if limit != sys.maxsize else "不限数量"
+        for path, html in pages:
+            multi = crawler.collect_pairs(crawler.extract_multi_pass(html), limit, verbose=False)
+            single = crawler.collect_pairs(crawler.extract_single_pass(html, limit).items(), limit, verbose=False)
+            if multi != single:
+                logger.error(f"❌ 结果不一致 ({label}): {path}")
+                return False
+        
+        timings = {}
+        for name, extract in (('逐个方法', lambda html: crawler.extract_multi_pass(html)),
+                              ('合并扫描', lambda html: crawler.extract_single_pass(html, limit).items())):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for _, html in pages:
+                    crawler.collect_pairs(extract(html), limit, verbose=False)
+            timings[name] = (time.perf_counter() - start) / rounds
+        
+        speedup = timings['逐个方法'] / timings['合并扫描'] if timings['合并扫描'] else 0
+        logger.info(f"  {label}: 逐个方法 {timings['逐个方法'] * 1000:.2f} ms，"
+                    f"合并扫描 {timings['合并扫描'] * 1000:.2f} ms，加速 {speedup:.2f}x（结果一致）")
+    return True
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="FOFA爬虫 - 高级反反爬版")
+    parser.add_argument('--benchmark-extract', nargs='*', metavar='HTML',
+                        help="对比合并扫描与逐个方法提取的耗时，默认使用 debug_responses 中保存的页面")
+    parser.add_argument('--rounds', type=int, default=20, help="基准测试的重复次数")
+    args = parser.parse_args()
+    
+    if args.benchmark_extract is not None:
+        paths = args.benchmark_extract or sorted(glob.glob("debug_responses/response_*.html"))
+        if not paths:
+            logger.error("❌ 没有可用于基准测试的页面")
+            sys.exit(1)
+        sys.exit(0 if benchmark_extraction(paths, args.rounds) else 1)
+    
     crawler = AdvancedFOFACrawler("config.json")
     
     try:
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Cloudflare IP段扫描
+不依赖第三方优选接口，在本地从CIDR列表中找出延迟最低的IP：
+    1. 分层抽样：每个 /24 随机抽取少量地址，并发探测
+    2. 细化：取表现最好的若干个 /24，抽取更多地址并多次探测
+    3. 按丢包率和中位延迟排序，输出与vps789接口结构相同的JSON，
+       可作为 ip_sources 中的数据源交给 generate_nodes.py 生成节点
+
+地址只在抽样时按整数生成，不展开整个网段，几十万候选地址也只占用与抽样数相当的内存
+
+用法:
+    python v_node/cidr_scanner.py -o v_node/scan_result.json
+    python v_node/cidr_scanner.py --ranges-file ranges.txt --per-subnet 2 --refine 20 --top 20
+    python v_node/cidr_scanner.py 127.0.0.0/16 --port 8443 --top 5
+
+生成节点时使用扫描结果（config.json 的 ip_sources 中增加）:
+    {"name": "scan", "url": "file:v_node/scan_result.json",
+     "categories": [{"path": "data.good", "provider": "本地扫描", "limit": 10}]}
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import os
+import random
+import time
+from datetime import datetime
+
+from generate_nodes import get_config
+from probe_nodes import PROBE_MODES, ProbeTarget, median, write_report
+from probe_pacing import ProbePacer
+
+# Cloudflare 公布的IPv4段 https://www.cloudflare.com/ips-v4
+CLOUDFLARE_RANGES = [
+    "173.245.48.0/20",
+    "103.21.244.0/22",
+    "103.22.200.0/22",
+    "103.31.4.0/22",
+    "141.101.64.0/18",
+    "108.162.192.0/18",
+    "190.93.240.0/20",
+    "188.114.96.0/20",
+    "197.234.240.0/22",
+    "198.41.128.0/17",
+    "162.158.0.0/15",
+    "104.16.0.0/13",
+    "104.24.0.0/14",
+    "172.64.0.0/13",
+    "131.0.72.0/22"
+]
+
+
+def load_ranges(values=None, path=None):
+    """解析CIDR列表（命令行参数或每行一个的文件，#后为注释），只保留IPv4"""
+    entries = list(values or [])
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries += [line.split('#', 1)[0].strip() for line in f]
+    networks = []
+    for entry in entries or CLOUDFLARE_RANGES:
+        if not entry:
+            continue
+        try:
+            network = ipaddress.ip_network(entry, strict=False)
+        except ValueError:
+            print(f"警告: 无效的CIDR，已跳过: {entry}")
+            continue
+        if network.version != 4:
+            print(f"警告: 暂不支持IPv6段，已跳过: {entry}")
+            continue
+        networks.append(network)
+    return networks
+
+
+def iter_strata(networks):
+    """按 /24 划分抽样层，返回 (起始地址整数, 地址数)；小于 /24 的网段自成一层"""
+    seen = set()
+    for network in networks:
+        if network.prefixlen >= 24:
+            strata = [(int(network.network_address), network.num_addresses)]
+        else:
+            base = int(network.network_address)
+            strata = ((base + offset, 256) for offset in range(0, network.num_addresses, 256))
+        for stratum in strata:
+            if stratum[0] not in seen:
+                seen.add(stratum[0])
+                yield stratum
+
+
+def sample_stratum(start, size, count, rng, exclude=()):
+    """在一层中不重复地抽取count个地址；/24会跳过 .0 和 .255"""
+    low, high = (1, size - 1) if size == 256 else (0, size)
+    pool = high - low
+    count = min(count, pool - len(exclude))
+    picked = []
+    chosen = set(exclude)
+    if count <= 0:
+        return picked
+    while len(picked) < count:
+        address = start + low + rng.randrange(pool)
+        if address not in chosen:
+            chosen.add(address)
+            picked.append(address)
+    return picked
+
+
+def stratum_cidr(start, size):
+    return f"{ipaddress.IPv4Address(start)}/{32 - (size - 1).bit_length()}"
+
+
+async def probe_addresses(addresses, port, mode='tcp', samples=1, concurrency=500, timeout=2.0,
+                          options=None):
+    """用固定数量的worker并发探测地址迭代器，不为每个地址预先创建任务
+
+    返回 ({地址整数: [成功耗时(秒), ...]}, {地址整数: 尝试次数}, 总探测次数)
+    """
+    options = options or {}
+    probe = PROBE_MODES[mode]
+    pacer = options.get('pacer')
+    params = options.get('params', {})
+    iterator = iter(addresses)
+    successes = {}
+    attempts = {}
+    total = 0
+
+    async def worker():
+        nonlocal total
+        # 所有worker共享同一个迭代器，事件循环单线程，不会重复取到同一地址
+        for address in iterator:
+            target = ProbeTarget('', str(ipaddress.IPv4Address(address)), port, params, '')
+            attempts[address] = samples
+            for _ in range(samples):
+                if pacer is not None:
+                    await pacer.acquire(target)
+                total += 1
+                try:
+                    timings = await probe(target, timeout, options)
+                except Exception:
+                    continue
+                successes.setdefault(address, []).append(timings['total'])
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return successes, attempts, total
+
+
+async def scan(networks, port=443, mode='tcp', per_subnet=2, refine=20, refine_per_subnet=16,
+               refine_samples=3, concurrency=500, timeout=2.0, options=None, seed=None):
+    """两阶段扫描，返回 (候选列表（已排序）, 统计信息)
+
+    候选: {'address', 'subnet', 'latency_ms', 'loss'}，按 (丢包率, 中位延迟) 升序
+    """
+    rng = random.Random(seed)
+    strata = list(iter_strata(networks))
+    rng.shuffle(strata)
+    candidates = sum(size - 2 if size == 256 else size for _, size in strata)
+    stats = {'ranges': len(networks), 'subnets': len(strata), 'candidates': candidates}
+
+    # 第一阶段：每层抽取per_subnet个地址；按轮次交错，同一 /24 的探测不会挤在一起
+    picks = [sample_stratum(start, size, per_subnet, rng) for start, size in strata]
+    origin = {address: index for index, pick in enumerate(picks) for address in pick}
+    stage_one = (pick[round_index] for round_index in range(per_subnet)
+                 for pick in picks if round_index < len(pick))
+    start = time.perf_counter()
+    successes, attempts, probes = await probe_addresses(stage_one, port, mode, 1, concurrency,
+                                                        timeout, options)
+    stats['stage1'] = {'probes': probes, 'reachable': len(successes),
+                       'elapsed_s': round(time.perf_counter() - start, 3)}
+
+    # 每层的得分为其中可达地址的中位延迟
+    by_stratum = {}
+    for address, values in successes.items():
+        by_stratum.setdefault(origin[address], []).append(min(values))
+    best = sorted(by_stratum, key=lambda index: median(by_stratum[index]))[:refine]
+
+    # 第二阶段：在最好的几层中追加抽样，连同第一阶段的可达地址一起多次探测
+    refined = []
+    for index in best:
+        stratum_start, size = strata[index]
+        refined += [address for address in picks[index] if address in successes]
+        extra = sample_stratum(stratum_start, size, refine_per_subnet, rng, exclude=picks[index])
+        origin.update((address, index) for address in extra)
+        refined += extra
+    start = time.perf_counter()
+    successes, attempts, probes = await probe_addresses(refined, port, mode, refine_samples,
+                                                        concurrency, timeout, options)
+    stats['stage2'] = {'subnets': len(best), 'addresses': len(refined), 'probes': probes,
+                       'reachable': len(successes), 'elapsed_s': round(time.perf_counter() - start, 3)}
+
+    results = []
+    for address, values in successes.items():
+        results.append({
+            'address': str(ipaddress.IPv4Address(address)),
+            'subnet': stratum_cidr(*strata[origin[address]]),
+            'latency_ms': round(median(values) * 1000, 2),
+            'loss': round(1 - len(values) / attempts[address], 4)
+        })
+    results.sort(key=lambda item: (item['loss'], item['latency_ms']))
+    return results, stats
+
+
+def build_payload(results, top, stats):
+    """输出与vps789 cfIpTop20接口相同的结构：data.good 为候选IP列表"""
+    return {
+        'code': 0,
+        'source': 'cidr_scanner',
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'stats': stats,
+        'data': {
+            'good': [
+                {
+                    'ip': item['address'],
+                    'avgLatency': item['latency_ms'],
+                    'lossRate': item['loss'],
+                    'subnet': item['subnet']
+                }
+                for item in results[:top]
+            ]
+        }
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Cloudflare IP段扫描")
+    parser.add_argument('ranges', nargs='*', help="CIDR段，默认使用Cloudflare公布的IPv4段")
+    parser.add_argument('--ranges-file', help="CIDR列表文件，每行一个")
+    parser.add_argument('-o', '--output', default="v_node/scan_result.json", help="结果JSON路径")
+    parser.add_argument('-p', '--port', type=int, default=443, help="探测端口")
+    parser.add_argument('-m', '--mode', choices=['tcp', 'tls'], default='tcp', help="探测方式")
+    parser.add_argument('--sni', help="tls模式使用的SNI，默认使用config.json中vless_config的sni")
+    parser.add_argument('--per-subnet', type=int, default=2, help="第一阶段每个/24抽取的地址数")
+    parser.add_argument('--refine', type=int, default=20, help="第二阶段细化的/24数量")
+    parser.add_argument('--refine-per-subnet', type=int, default=16, help="第二阶段每个/24追加抽取的地址数")
+    parser.add_argument('--refine-samples', type=int, default=3, help="第二阶段每个地址的探测次数")
+    parser.add_argument('--top', type=int, default=20, help="输出的候选IP数量")
+    parser.add_argument('-c', '--concurrency', type=int, default=500, help="最大并发数")
+    parser.add_argument('-t', '--timeout', type=float, default=2.0, help="单次探测超时（秒）")
+    parser.add_argument('--rate', type=float, help="全局限速：每秒最多发起的探测数")
+    parser.add_argument('--subnet-rate', type=float, help="每个/24每秒最多发起的探测数")
+    parser.add_argument('--seed', type=int, help="随机种子，便于复现抽样")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    networks = load_ranges(args.ranges, args.ranges_file)
+    if not networks:
+        print("❌ 没有可扫描的IP段")
+        return 1
+
+    options = {}
+    sni = args.sni
+    if args.mode == 'tls' and not sni:
+        # Cloudflare会拒绝以裸IP作为SNI的握手，默认使用节点的SNI
+        sni = get_config().sni
+    if sni:
+        options['params'] = {'sni': sni}
+    if args.rate or args.subnet_rate:
+        options['pacer'] = ProbePacer(args.rate, None, args.subnet_rate, None, 5.0)
+
+    print(f"扫描 {len(networks)} 个IP段: 方式 {args.mode}，端口 {args.port}，并发 {args.concurrency}")
+    start = time.perf_counter()
+    results, stats = asyncio.run(scan(
+        networks, args.port, args.mode, args.per_subnet, args.refine, args.refine_per_subnet,
+        args.refine_samples, args.concurrency, args.timeout, options, args.seed))
+    stats['elapsed_s'] = round(time.perf_counter() - start, 3)
+
+    print(f"   候选地址 {stats['candidates']} 个，分为 {stats['subnets']} 个/24")
+    print(f"   第一阶段: {stats['stage1']['probes']} 次探测，{stats['stage1']['reachable']} 个可达，"
+          f"耗时 {stats['stage1']['elapsed_s']:.2f} 秒")
+    print(f"   第二阶段: {stats['stage2']['subnets']} 个/24，{stats['stage2']['addresses']} 个地址，"
+          f"{stats['stage2']['probes']} 次探测，耗时 {stats['stage2']['elapsed_s']:.2f} 秒")
+
+    output_dir = os.path.dirname(args.output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    payload = build_payload(results, args.top, stats)
+    write_report(payload, args.output)
+    print(f"✅ 完成，耗时 {stats['elapsed_s']:.2f} 秒")
+    for index, item in enumerate(results[:args.top], 1):
+        print(f"   {index:2d}. {item['latency_ms']:8.2f} ms  丢包 {item['loss']:.0%}  "
+              f"{item['address']}  ({item['subnet']})")
+    print(f"结果已写入: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+导入Clash客户端的延迟历史
+生成的YAML都开启了 external-controller: 127.0.0.1:9090，客户端每300秒会对节点做url-test，
+控制器的 /proxies 接口中保留了每个节点最近的测速记录。这里读取这些记录（在线读取或导出的JSON），
+按节点名称对应回地址，写入延迟历史库（latency_history.db），下次生成节点时参与评分。
+
+延迟为0表示测速失败，按失败样本记录。客户端延迟包含经由代理的完整请求，通常高于TCP连接耗时，
+因此记在单独的 client 来源下，以 scoring 中的 client_history 权重计分，不与本地探测的EWMA混合。
+
+用法:
+    python v_node/clash_history.py
+    python v_node/clash_history.py --controller http://127.0.0.1:9090 --secret xxxx
+    python v_node/clash_history.py --dump proxies.json --nodes YXNode
+"""
+
+import argparse
+import json
+import re
+import urllib.request
+from datetime import datetime
+
+from latency_history import LatencyHistory
+from probe_nodes import read_node_file
+
+# 节点名称格式: 运营商[-colo]-序号-地址
+NAME_PATTERN = re.compile(r'-\d{2,}-([^\s]+)$')
+FRACTION_PATTERN = re.compile(r'\.(\d+)')
+
+
+def fetch_proxies(controller="http://127.0.0.1:9090", secret=None, timeout=5):
+    """从Clash控制器读取 /proxies"""
+    headers = {'Accept': 'application/json'}
+    if secret:
+        headers['Authorization'] = f"Bearer {secret}"
+    req = urllib.request.Request(f"{controller.rstrip('/')}/proxies", headers=headers)
+    with urllib.request.urlopen(req, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def load_dump(path):
+    """读取导出的 /proxies JSON"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def parse_time(text):
+    """解析Clash的时间（RFC3339，可能带纳秒和Z），返回Unix时间戳，失败返回None
+
+    Go的RFC3339Nano会省略小数末尾的0（如 .5、.12345），
+    Python 3.10及以前的fromisoformat只接受3或6位小数，这里统一补齐或截断为6位
+    """
+    if not isinstance(text, str):
+        return None
+    text = FRACTION_PATTERN.sub(lambda match: '.' + match.group(1)[:6].ljust(6, '0'), text.strip())
+    if text.endswith('Z'):
+        text = text[:-1] + '+00:00'
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+
+def build_name_map(node_file=None):
+    """节点名称 → (address, port)，来自节点文件（如 YXNode）"""
+    if not node_file:
+        return {}
+    try:
+        targets = read_node_file(node_file)
+    except OSError as e:
+        print(f"警告: 无法读取节点文件 {node_file}: {e}")
+        return {}
+    return {target.name: (target.address, target.port) for target in targets}
+
+
+def extract_samples(proxies, name_map, default_port=443):
+    """从 /proxies 数据中取出延迟样本
+
+    返回 ([(address, port, ts, 延迟ms或None), ...], 匹配的节点数, 未匹配的节点名称列表)
+    代理组（Selector、URLTest等）和DIRECT/REJECT没有自己的地址，名称也无法匹配，自然被跳过
+    """
+    samples = []
+    matched = 0
+    unmatched = []
+    for name, proxy in (proxies.get('proxies') or {}).items():
+        history = proxy.get('history') or []
+        if not history or proxy.get('all'):
+            continue
+        location = name_map.get(name)
+        if location is None:
+            match = NAME_PATTERN.search(name)
+            if not match:
+                unmatched.append(name)
+                continue
+            location = (match.group(1), default_port)
+        matched += 1
+        address, port = location
+        for entry in history:
+            ts = parse_time(entry.get('time'))
+            delay = entry.get('delay')
+            if ts is None or not isinstance(delay, (int, float)):
+                continue
+            samples.append((address, port, ts, float(delay) if delay > 0 else None))
+    return samples, matched, unmatched
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="导入Clash控制器中的节点延迟历史")
+    parser.add_argument('--controller', default="http://127.0.0.1:9090", help="Clash控制器地址")
+    parser.add_argument('--secret', help="控制器密钥")
+    parser.add_argument('--dump', help="导出的 /proxies JSON文件，指定时不访问控制器")
+    parser.add_argument('--nodes', default="YXNode", help="用于把节点名称对应回地址的节点文件")
+    parser.add_argument('--port', type=int, default=443, help="节点文件中找不到名称时使用的端口")
+    parser.add_argument('--db', default="v_node/latency_history.db", help="延迟历史库路径")
+    args = parser.parse_args(argv)
+
+    try:
+        proxies = load_dump(args.dump) if args.dump else fetch_proxies(args.controller, args.secret)
+    except (OSError, ValueError) as e:
+        print(f"❌ 读取延迟历史失败: {e}")
+        return 1
+
+    samples, matched, unmatched = extract_samples(proxies, build_name_map(args.nodes), args.port)
+    # 不晚于已导入记录的样本会被跳过，重复导入不会重复计数
+    with LatencyHistory(args.db) as history:
+        count = history.record_many(samples, source='client')
+    print(f"✅ 匹配 {matched} 个节点，共 {len(samples)} 个样本，导入 {count} 个新样本到 {args.db}")
+    if unmatched:
+        print(f"   未匹配 {len(unmatched)} 个节点，例如: {', '.join(unmatched[:5])}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Cloudflare数据中心（colo）识别
+通过每个候选IP请求 /cdn-cgi/trace（SNI与Host使用节点域名），解析返回的 colo= 与 loc= 字段，
+得到该IP实际落在哪个边缘节点。结果按地址缓存，TTL内不重复请求。
+
+用法:
+    python v_node/colo_trace.py YXNode
+    python v_node/colo_trace.py HK900 --only HKG,NRT -o HK900.colo
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from probe_nodes import get_ssl_context, read_node_file
+
+TRACE_PATH = "/cdn-cgi/trace"
+
+
+def parse_trace(body):
+    """解析trace格式（每行 key=value）的响应正文"""
+    fields = {}
+    for line in body.splitlines():
+        key, sep, value = line.partition('=')
+        if sep and key.strip():
+            fields[key.strip()] = value.strip()
+    return fields
+
+
+async def fetch_trace(address, port, host, sni=None, use_tls=True, timeout=5.0, path=TRACE_PATH,
+                      verify=False):
+    """经由address:port请求trace，返回解析后的字段；使用HTTP/1.0，响应不会是分块编码"""
+    context = get_ssl_context(('http/1.1',), verify) if use_tls else None
+
+    async def request():
+        reader, writer = await asyncio.open_connection(
+            address, port, ssl=context, server_hostname=(sni or host) if use_tls else None)
+        try:
+            writer.write((
+                f"GET {path} HTTP/1.0\r\n"
+                f"Host: {host}\r\n"
+                "User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36\r\n"
+                "Accept: */*\r\n"
+                "Connection: close\r\n"
+                "\r\n"
+            ).encode('ascii'))
+            data = bytearray()
+            while len(data) < 65536:
+                chunk = await reader.read(65536)
+                if not chunk:
+                    break
+                data += chunk
+            return bytes(data)
+        finally:
+            writer.close()
+
+    data = await asyncio.wait_for(request(), timeout)
+    head, _, body = data.partition(b"\r\n\r\n")
+    status_line = head.split(b"\r\n", 1)[0].decode('latin-1')
+    parts = status_line.split(' ', 2)
+    if len(parts) < 2 or parts[1] != '200':
+        raise ValueError(f"HTTP状态异常: {status_line}")
+    return parse_trace(body.decode('utf-8', 'replace'))
+
+
+class ColoCache:
+    """按地址缓存colo信息的JSON文件，超过ttl秒的记录视为过期"""
+
+    def __init__(self, path="v_node/.cache/colo.json", ttl=86400):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, address, now=None):
+        entry = self.entries.get(address)
+        now = time.time() if now is None else now
+        if entry and now - entry.get('ts', 0) < self.ttl:
+            return entry
+        return None
+
+    def put(self, address, colo, loc, now=None):
+        self.entries[address] = {'colo': colo, 'loc': loc, 'ts': time.time() if now is None else now}
+
+    def save(self):
+        """写回缓存文件（临时文件+原子替换），顺便丢弃过期记录"""
+        now = time.time()
+        self.entries = {address: entry for address, entry in self.entries.items()
+                        if now - entry.get('ts', 0) < self.ttl}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+async def lookup_colos(addresses, port, host, sni=None, use_tls=True, concurrency=50, timeout=5.0,
+                       cache=None):
+    """并发查询每个地址的colo，返回 {address: {'colo', 'loc'}}；失败的地址不在结果中"""
+    results = {}
+    pending = []
+    for address in dict.fromkeys(addresses):
+        entry = cache.get(address) if cache else None
+        if entry:
+            results[address] = {'colo': entry['colo'], 'loc': entry.get('loc')}
+        else:
+            pending.append(address)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(address):
+        async with semaphore:
+            try:
+                fields = await fetch_trace(address, port, host, sni, use_tls, timeout)
+            except Exception:
+                return
+        colo = fields.get('colo')
+        if colo:
+            results[address] = {'colo': colo, 'loc': fields.get('loc')}
+            if cache:
+                cache.put(address, colo, fields.get('loc'))
+
+    await asyncio.gather(*(lookup(address) for address in pending))
+    return results
+
+
+def resolve_colos(addresses, port, host, sni=None, use_tls=True, concurrency=50, timeout=5.0,
+                  cache=None):
+    """lookup_colos的同步版本，查询后保存缓存"""
+    results = asyncio.run(lookup_colos(addresses, port, host, sni, use_tls, concurrency, timeout, cache))
+    if cache:
+        cache.save()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="通过 /cdn-cgi/trace 识别节点IP所在的数据中心")
+    parser.add_argument('node_file', help="节点文件路径，如 YXNode、HK900")
+    parser.add_argument('--only', help="只保留这些colo（逗号分隔，如 HKG,NRT）")
+    parser.add_argument('-o', '--output', help="输出节点文件，名称后追加colo")
+    parser.add_argument('-c', '--concurrency', type=int, default=50, help="最大并发数")
+    parser.add_argument('-t', '--timeout', type=float, default=5.0, help="单次请求超时（秒）")
+    parser.add_argument('--cache', default="v_node/.cache/colo.json", help="colo缓存文件")
+    parser.add_argument('--ttl', type=float, default=86400, help="缓存有效期（秒）")
+    args = parser.parse_args(argv)
+
+    targets = read_node_file(args.node_file)
+    if not targets:
+        print(f"❌ 未从 {args.node_file} 解析到任何节点")
+        return 1
+
+    cache = ColoCache(args.cache, args.ttl)
+    start = time.perf_counter()
+    colos = {}
+    # 按 (端口, Host, SNI, 是否TLS) 分组批量查询
+    groups = {}
+    for target in targets:
+        groups.setdefault((target.port, target.host, target.sni, target.use_tls), []).append(target.address)
+    for (port, host, sni, use_tls), addresses in groups.items():
+        colos.update(resolve_colos(addresses, port, host, sni, use_tls, args.concurrency, args.timeout, cache))
+    elapsed = time.perf_counter() - start
+
+    by_colo = {}
+    for target in targets:
+        info = colos.get(target.address)
+        by_colo.setdefault(info['colo'] if info else '未知', []).append(target)
+    print(f"✅ {len(targets)} 个节点，识别 {sum(1 for t in targets if t.address in colos)} 个，"
+          f"耗时 {elapsed:.2f} 秒")
+    for colo, members in sorted(by_colo.items(), key=lambda item: -len(item[1])):
+        print(f"   {colo}: {len(members)} 个")
+
+    if args.output:
+        only = {code.strip().upper() for code in args.only.split(',')} if args.only else None
+        written = 0
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for target in targets:
+                info = colos.get(target.address)
+                if only is not None and (not info or info['colo'] not in only):
+                    continue
+                line = target.line
+                if info:
+                    line = f"{line.split('#', 1)[0]}#{target.name}-{info['colo']}"
+                f.write(line + "\n")
+                written += 1
+        print(f"已写入 {written} 个节点: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,71 +1,386 @@
+import hashlib
+import io
 import json
 import urllib.request
 import time
 import os
 import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from types import MappingProxyType
 from urllib.parse import urlparse
 
+from http_cache import ResponseCache
+from ip_sources import load_sources
+from latency_history import LatencyHistory
+from retry_policy import RetryPolicy
+from scoring import CandidateScorer
+from snapshot_store import SnapshotStore
+
+CONFIG_PATH = 'v_node/config.json'
+
 def load_config():
     """加载配置文件"""
     try:
-        with open('v_node/config.json', 'r', encoding='utf-8') as f:
+        with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
             return json.load(f)
     except:
-        # 默认配置
-        return {
-            "vless_config": {
-                "uuid": "471a8e64-7b21-4703-b1d1-45a221098459",
-                "domain": "knny.dpdns.org",
-                "port": 443,
-                "path": "/?ed=2048",
-                "encryption": "none",
-                "security": "tls",
-                "sni": "knny.dpdns.org",
-                "fingerprint": "chrome",
-                "network": "ws"
-            },
-            "api_config": {
-                "top20_url": "https://vps789.com/openApi/cfIpTop20",
-                "isp_url": "https://vps789.com/openApi/cfIpApi"
-            },
-            "naming_rules": {
-                "top20_prefix": "综合优选",
-                "ct_prefix": "电信优选",
-                "cu_prefix": "联通优选",
-                "cm_prefix": "移动优选",
-                "allavg_prefix": "全网优选"
-            }
+        return load_default_config()
+
+def load_default_config():
+    """默认配置"""
+    return {
+        "vless_config": {
+            "uuid": "471a8e64-7b21-4703-b1d1-45a221098459",
+            "domain": "knny.dpdns.org",
+            "port": 443,
+            "path": "/?ed=2048",
+            "encryption": "none",
+            "security": "tls",
+            "sni": "knny.dpdns.org",
+            "fingerprint": "chrome",
+            "network": "ws"
+        },
+        "api_config": {
+            "top20_url": "https://vps789.com/openApi/cfIpTop20",
+            "isp_url": "https://vps789.com/openApi/cfIpApi"
+        },
+        "naming_rules": {
+            "top20_prefix": "综合优选",
+            "ct_prefix": "电信优选",
+            "cu_prefix": "联通优选",
+            "cm_prefix": "移动优选",
+            "allavg_prefix": "全网优选"
+        },
+        "cache_config": {
+            "enabled": True,
+            "dir": "v_node/.cache",
+            "ttl": 600
+        },
+        "retry_config": {
+            "max_attempts": 4,
+            "base_delay": 1.0,
+            "max_delay": 30.0,
+            "jitter": 0.5,
+            "total_budget": 120.0
         }
+    }
 
-def fetch_api_with_retry(url, max_retries=2, retry_delay=180):
-    """获取API数据，失败后重试"""
-    for attempt in range(max_retries):
+REQUIRED_VLESS_KEYS = ('uuid', 'domain', 'port', 'path', 'encryption',
+                       'security', 'fingerprint', 'network')
+
+def freeze(value):
+    """递归转换为只读结构：dict转为MappingProxyType，list转为tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+EMPTY_SECTION = MappingProxyType({})
+
+class CompiledConfig:
+    """校验并预计算后的只读配置
+    
+    运营商名称映射、静态链接参数及查询串、默认SNI/Host只计算一次，
+    生成节点时直接复用，不再逐节点读取配置文件。
+    """
+    __slots__ = ('_sections', 'vless', 'api', 'naming', 'provider_names',
+                 'params', 'query_string', 'sni', 'host', 'uuid', 'port', 'path')
+
+    def __init__(self, raw):
+        vless = raw.get('vless_config', {})
+        missing = [key for key in REQUIRED_VLESS_KEYS if key not in vless]
+        if missing:
+            raise ValueError(f"vless_config 缺少字段: {', '.join(missing)}")
+        naming = raw.get('naming_rules', {})
+        host = vless['domain']
+        sni = vless.get('sni', host)
+        params = (
+            ('encryption', vless['encryption']),
+            ('security', vless['security']),
+            ('sni', sni),                     # SNI: knny.dpdns.org
+            ('fp', vless['fingerprint']),
+            ('insecure', '1'),
+            ('allowInsecure', '1'),
+            ('type', vless['network']),
+            ('host', host),                   # 伪装域名: knny.dpdns.org
+            ('path', vless['path'])
+        )
+        provider_names = {
+            "top20": naming.get('top20_prefix', '综合优选'),
+            "CT": naming.get('ct_prefix', '电信优选'),
+            "CU": naming.get('cu_prefix', '联通优选'),
+            "CM": naming.get('cm_prefix', '移动优选'),
+            "AllAvg": naming.get('allavg_prefix', '全网优选')
+        }
+        sections = freeze(raw)
+        values = {
+            '_sections': sections,
+            'vless': sections['vless_config'],
+            'api': sections.get('api_config', EMPTY_SECTION),
+            'naming': sections.get('naming_rules', EMPTY_SECTION),
+            'provider_names': MappingProxyType(provider_names),
+            'params': params,
+            'query_string': '&'.join(f"{name}={value}" for name, value in params),
+            'sni': sni,
+            'host': host,
+            'uuid': vless['uuid'],
+            'port': vless['port'],
+            'path': vless['path']
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledConfig 为只读对象")
+
+    def section(self, name, default=EMPTY_SECTION):
+        """获取任意配置段（只读视图），不存在时返回default"""
+        return self._sections.get(name, default)
+
+_config_lock = threading.Lock()
+_config_cache = {'mtime': None, 'config': None}
+
+def get_config():
+    """获取编译后的配置，仅在config.json的mtime变化时重新加载"""
+    try:
+        mtime = os.stat(CONFIG_PATH).st_mtime_ns
+    except OSError:
+        mtime = None
+    
+    with _config_lock:
+        cached = _config_cache['config']
+        if cached is not None and _config_cache['mtime'] == mtime:
+            return cached
+        
+        raw = load_config()
         try:
-            print(f"  尝试 {attempt + 1}/{max_retries}: 请求 {url}")
-            req = urllib.request.Request(
-                url,
-                headers={
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                    'Accept': 'application/json'
-                }
-            )
-            with urllib.request.urlopen(req, timeout=15) as response:
-                data = json.loads(response.read())
+            compiled = CompiledConfig(raw)
+        except ValueError as e:
+            # 只替换vless_config，保留用户的数据源、缓存、重试等其他配置
+            print(f"配置校验失败: {e}，vless_config 使用默认配置")
+            compiled = CompiledConfig(dict(raw, vless_config=load_default_config()['vless_config']))
+        _config_cache['mtime'] = mtime
+        _config_cache['config'] = compiled
+        return compiled
+
+def load_cached_payload(entry, is_valid):
+    """解析缓存条目中的数据，条目损坏或数据不是成功的响应时返回None"""
+    try:
+        data = json.loads(entry['body'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return data if is_valid(data) else None
+
+def fetch_api_with_retry(url, policy=None, timeout=15, cache=None, is_valid=None):
+    """获取API数据，按重试策略指数退避重试
+    
+    传入cache时：TTL内直接使用缓存；过期则发送条件请求，304视为命中。
+    只有通过 is_valid（默认 is_valid_payload）校验的响应才会写入缓存或被重验证，
+    避免把 {"code":1,"msg":"busy"} 之类的错误数据在TTL内反复重放
+    """
+    if policy is None:
+        policy = RetryPolicy()
+    if is_valid is None:
+        is_valid = is_valid_payload
+    if url.startswith('file:'):
+        # 本地文件（如 cidr_scanner.py 的扫描结果）不缓存，每次读取最新内容
+        cache = None
+    
+    entry = cache.get(url) if cache else None
+    cached_data = load_cached_payload(entry, is_valid) if entry else None
+    if cached_data is None:
+        # 旧版本可能缓存过错误数据，不再使用也不据此发送条件请求
+        entry = None
+    elif cache.is_fresh(entry):
+        cache.record_hit(url)
+        print(f"  缓存命中: {url}")
+        return cached_data
+    
+    attempt = 0
+    while True:
+        attempt += 1
+        if policy.remaining() <= 0:
+            print(f"  总时限已用完，放弃请求 {url}")
+            return None
+        try:
+            print(f"  尝试 {attempt}/{policy.max_attempts}: 请求 {url}")
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+                'Accept': 'application/json'
+            }
+            if cache:
+                headers.update(cache.conditional_headers(entry))
+            req = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(req, timeout=policy.attempt_timeout(timeout)) as response:
+                body = response.read().decode('utf-8')
+                data = json.loads(body)
+                if not is_valid(data):
+                    print(f"  接口返回错误数据，不写入缓存: {str(data)[:200]}")
+                    return data
+                if cache:
+                    cache.put(url, body,
+                              etag=response.headers.get('ETag'),
+                              last_modified=response.headers.get('Last-Modified'))
+                    cache.record_miss()
                 print(f"  请求成功")
                 return data
-        except urllib.error.URLError as e:
-            print(f"  请求失败: {e}")
-            if attempt < max_retries - 1:
-                print(f"  {retry_delay}秒后重试...")
-                time.sleep(retry_delay)
-            else:
-                print(f"  达到最大重试次数，放弃请求")
-                return None
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and entry:
+                cache.touch(url, entry)
+                cache.record_hit(url, revalidated=True)
+                print(f"  内容未变化(304)，使用缓存")
+                return cached_data
+            error = e
         except Exception as e:
-            print(f"  其他错误: {e}")
+            error = e
+        
+        print(f"  请求失败: {type(error).__name__}: {error}")
+        delay = policy.next_delay(attempt, error)
+        if delay is None:
+            if not policy.is_retryable(error):
+                print(f"  错误不可重试，放弃请求")
+            else:
+                print(f"  达到重试上限或总时限，放弃请求")
             return None
-    return None
+        print(f"  {delay:.1f}秒后重试...")
+        time.sleep(delay)
+
+def create_response_cache(cache_config):
+    """根据cache_config配置段创建响应缓存，未启用时返回None"""
+    if not cache_config.get('enabled', True):
+        return None
+    return ResponseCache(
+        cache_dir=cache_config.get('dir', 'v_node/.cache'),
+        ttl=cache_config.get('ttl', 600)
+    )
+
+def create_snapshot_store(snapshot_config):
+    """根据snapshot_config配置段创建快照存储，未启用时返回None"""
+    if not snapshot_config.get('enabled', True):
+        return None
+    return SnapshotStore(
+        directory=snapshot_config.get('dir', 'v_node/snapshots'),
+        retention=snapshot_config.get('retention', 5),
+        max_age=snapshot_config.get('max_age', 172800)
+    )
+
+def load_latency_history(history_config, port):
+    """读取延迟历史库中各地址的EWMA延迟，未启用或库不存在时返回空字典
+
+    返回 {评分指标: {地址: EWMA延迟ms}}：本地探测记为 history，Clash客户端url-test记为 client_history
+    """
+    db_path = history_config.get('db', 'v_node/latency_history.db')
+    if not history_config.get('enabled', False) or not os.path.exists(db_path):
+        return {}
+    try:
+        with LatencyHistory(db_path) as history:
+            max_failures = history_config.get('max_failures', 3.0)
+            return {
+                'history': history.ewma_map(port=port, max_failures=max_failures),
+                'client_history': history.ewma_map(port=port, max_failures=max_failures, source='client')
+            }
+    except Exception as e:
+        print(f"  读取延迟历史库失败: {e}")
+        return {}
+
+def label_nodes_with_colo(nodes, colo_config, compiled):
+    """按 /cdn-cgi/trace 识别每个节点IP的数据中心，把colo加入分类和节点名称
+
+    例如 综合优选-01-1.2.3.4 变为 综合优选-HKG-01-1.2.3.4，Clash中按 综合优选-HKG 分组。
+    未启用或识别失败的节点保持原样，返回识别成功的节点数
+    """
+    if not colo_config.get('enabled', False):
+        return 0
+    # 按需导入：colo_trace 依赖asyncio/ssl探测模块，默认未启用时不加载
+    from colo_trace import ColoCache, resolve_colos
+    cache = ColoCache(colo_config.get('cache', 'v_node/.cache/colo.json'), colo_config.get('ttl', 86400))
+    try:
+        colos = resolve_colos(
+            [node.address for node in nodes], compiled.port,
+            colo_config.get('host') or compiled.host, compiled.sni,
+            compiled.vless.get('security') == 'tls',
+            colo_config.get('concurrency', 50), colo_config.get('timeout', 5.0), cache)
+    except Exception as e:
+        print(f"  识别数据中心失败: {e}")
+        return 0
+    labelled = 0
+    for node in nodes:
+        info = colos.get(node.address)
+        if not info:
+            continue
+        node.category = f"{node.category}-{info['colo']}"
+        node.description = f"{node.category}-{node.index+1:02d}-{node.address}"
+        labelled += 1
+    return labelled
+
+def is_valid_payload(data):
+    """API返回是否为成功的数据"""
+    return isinstance(data, dict) and data.get("code") == 0
+
+def apply_snapshot_fallback(source_data, store, now=None, validators=None, cached=()):
+    """保存成功的数据为快照；失败的数据源回退到有效期内的最新快照
+    
+    validators: {数据源: 校验函数}，未指定的数据源使用 is_valid_payload；
+    cached: 数据来自响应缓存的数据源，不另存快照，避免旧数据以当前时间占满保留名额
+    返回 (合并后的数据, {数据源: 使用的快照信息})
+    """
+    validators = validators or {}
+    merged = {}
+    fallbacks = {}
+    for name, data in source_data.items():
+        if validators.get(name, is_valid_payload)(data):
+            if name not in cached:
+                try:
+                    store.save(name, data, now=now)
+                except OSError as e:
+                    print(f"  保存快照失败 ({name}): {e}")
+            merged[name] = data
+            continue
+        
+        snapshot, info = store.latest(name, now=now)
+        if snapshot is not None:
+            print(f"  数据源 {name} 获取失败，使用快照: {info['path']} "
+                  f"(保存于 {datetime.fromtimestamp(info['saved_at']).strftime('%Y-%m-%d %H:%M:%S')}，"
+                  f"{info['age'] / 3600:.1f} 小时前)")
+            merged[name] = snapshot
+            fallbacks[name] = info
+        else:
+            print(f"  数据源 {name} 获取失败，且没有有效期内的快照")
+            merged[name] = data
+    return merged, fallbacks
+
+def fetch_sources_concurrently(sources, timeout=15, max_workers=8, cache=None, policy=None,
+                               validators=None, policies=None):
+    """并发获取多个数据源，总耗时取决于最慢的单个数据源
+    
+    sources: {名称: URL}，validators: {名称: 校验函数}，
+    policies: {名称: 重试策略}，未指定的数据源使用policy；返回 {名称: 数据或None}
+    """
+    validators = validators or {}
+    policies = policies or {}
+    if not sources:
+        return {}
+    
+    workers = max(1, min(max_workers, len(sources)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            name: executor.submit(fetch_api_with_retry, url, policy=policies.get(name, policy),
+                                  timeout=timeout, cache=cache,
+                                  is_valid=validators.get(name))
+            for name, url in sources.items()
+        }
+        results = {}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                print(f"  数据源 {name} 获取异常: {e}")
+                results[name] = None
+    return results
 
 def is_ip_address(host):
     """检查是否是IP地址"""
@@ -108,11 +423,41 @@ def get_ip_or_host(ip_data):
     # 如果都没有，返回空字符串
     return ""
 
-def generate_vless_url(ip_data, provider, index):
-    """生成VLESS节点链接"""
-    config = load_config()
-    vless_config = config['vless_config']
-    naming_rules = config['naming_rules']
+class VlessNode:
+    """VLESS节点记录：从API数据解析一次，各输出阶段（明文、Clash、统计）直接复用字段"""
+    __slots__ = ('address', 'port', 'uuid', 'params', 'category', 'index', 'description', 'query')
+
+    def __init__(self, address, port, uuid, params, category, index, description, query=None):
+        self.address = address
+        self.port = port
+        self.uuid = uuid
+        self.params = params  # ((key, value), ...)，保持参数顺序
+        self.category = category
+        self.index = index
+        self.description = description
+        self.query = query  # 预先拼接好的查询串，可与其他节点共享
+
+    def get_param(self, key, default=None):
+        """按名称获取链接参数"""
+        for name, value in self.params:
+            if name == key:
+                return value
+        return default
+
+    def to_url(self):
+        """渲染为VLESS明文链接"""
+        query = self.query
+        if query is None:
+            query = '&'.join(f"{name}={value}" for name, value in self.params)
+        return f"vless://{self.uuid}@{self.address}:{self.port}?{query}#{self.description}"
+
+    def __repr__(self):
+        return f"VlessNode({self.description!r})"
+
+def build_vless_node(ip_data, provider, index, config=None):
+    """从API数据构建VLESS节点记录"""
+    if config is None:
+        config = get_config()
     
     # 获取address（从API数据中提取的IP或域名）
     address = get_ip_or_host(ip_data)
@@ -120,45 +465,15 @@ def generate_vless_url(ip_data, provider, index):
         print(f"警告: 无法从数据中提取地址: {ip_data}")
         return None
     
-    # 运营商中文名称映射
-    provider_names = {
-        "top20": naming_rules.get('top20_prefix', '综合优选'),
-        "CT": naming_rules.get('ct_prefix', '电信优选'),
-        "CU": naming_rules.get('cu_prefix', '联通优选'),
-        "CM": naming_rules.get('cm_prefix', '移动优选'),
-        "AllAvg": naming_rules.get('allavg_prefix', '全网优选')
-    }
-    
     # 获取运营商名称
-    provider_name = provider_names.get(provider, provider)
+    provider_name = config.provider_names.get(provider, provider)
     
     # 生成中文描述 - 格式: 运营商-序号-完整地址
     description = f"{provider_name}-{index+1:02d}-{address}"
     
-    # 使用配置中的参数
-    uuid = vless_config['uuid']
-    host_domain = vless_config['domain']  # 伪装域名: knny.dpdns.org
-    port = vless_config['port']
-    path = vless_config['path']
-    sni = vless_config.get('sni', host_domain)  # SNI: knny.dpdns.org
-    
-    # 构建VLESS链接
-    # address使用从API获取的IP或域名
-    # host和SNI使用固定的knny.dpdns.org
-    vless_url = f"vless://{uuid}@{address}:{port}"
-    params = [
-        f"encryption={vless_config['encryption']}",
-        f"security={vless_config['security']}",
-        f"sni={sni}",                     # SNI: knny.dpdns.org
-        f"fp={vless_config['fingerprint']}",
-        "insecure=1",
-        "allowInsecure=1",
-        f"type={vless_config['network']}",
-        f"host={host_domain}",            # 伪装域名: knny.dpdns.org
-        f"path={path}"
-    ]
-    
-    return f"{vless_url}?{'&'.join(params)}#{description}"
+    # address使用从API获取的IP或域名，host和SNI使用配置中的固定域名
+    return VlessNode(address, config.port, config.uuid, config.params,
+                     provider_name, index, description, query=config.query_string)
 
 def get_unique_nodes(nodes):
     """去重节点，基于address"""
@@ -168,183 +483,249 @@ def get_unique_nodes(nodes):
     for node in nodes:
         if not node:
             continue
-            
-        # 提取address部分用于去重
-        try:
-            # 格式: vless://uuid@address:port?...#
-            node_url = node.split('#')[0]
-            node_base = node_url.split('@')[1].split('?')[0]
-            address = node_base.split(':')[0]
-            
-            if address not in seen:
-                seen.add(address)
-                unique_nodes.append(node)
-            else:
-                print(f"跳过重复地址: {address}")
-        except Exception as e:
-            print(f"解析节点失败: {e}")
-            unique_nodes.append(node)  # 如果解析失败，保留节点
+        
+        if node.address not in seen:
+            seen.add(node.address)
+            unique_nodes.append(node)
+        else:
+            print(f"跳过重复地址: {node.address}")
     
     return unique_nodes
 
-def generate_clash_config(unique_nodes, vless_config):
-    """生成Clash配置文件"""
+CLASH_HEADER = (
+    "port: 7890\n"
+    "socks-port: 7891\n"
+    "allow-lan: true\n"
+    "mode: rule\n"
+    "log-level: info\n"
+    "external-controller: 127.0.0.1:9090\n"
+    "proxies:\n"
+)
+
+DEFAULT_RULES = (
+    "  - DOMAIN-SUFFIX,openai.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,chat.openai.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,google.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,youtube.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,github.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,twitter.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,facebook.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,instagram.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,telegram.org,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,netflix.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,disneyplus.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,hulu.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,hbo.com,🌍 国外网站",
+    "  - DOMAIN-SUFFIX,cn,DIRECT",
+    "  - DOMAIN-KEYWORD,china,DIRECT",
+    "  - DOMAIN-SUFFIX,taobao.com,DIRECT",
+    "  - DOMAIN-SUFFIX,baidu.com,DIRECT",
+    "  - DOMAIN-SUFFIX,qq.com,DIRECT",
+    "  - DOMAIN-SUFFIX,163.com,DIRECT",
+    "  - DOMAIN-SUFFIX,sina.com.cn,DIRECT",
+    "  - DOMAIN-SUFFIX,weibo.com,DIRECT",
+    "  - DOMAIN-SUFFIX,zhihu.com,DIRECT",
+    "  - DOMAIN-SUFFIX,bilibili.com,DIRECT",
+    "  - IP-CIDR,10.0.0.0/8,DIRECT",
+    "  - IP-CIDR,172.16.0.0/12,DIRECT",
+    "  - IP-CIDR,192.168.0.0/16,DIRECT",
+    "  - IP-CIDR,127.0.0.0/8,DIRECT",
+    "  - GEOIP,LAN,DIRECT",
+    "  - GEOIP,CN,DIRECT",
+    "  - MATCH,🎯 全局代理"
+)
+
+def load_clash_rules(rules_file='rules.txt'):
+    """读取rules.txt中的自定义规则，文件不存在时返回默认规则"""
+    try:
+        with open(rules_file, 'r', encoding='utf-8') as f:
+            rules = [line.strip() for line in f]
+        print("已从rules.txt加载自定义规则")
+        return [line for line in rules if line and not line.startswith('#')]
+    except FileNotFoundError:
+        print("rules.txt文件未找到，使用默认规则")
+        return list(DEFAULT_RULES)
+
+def render_clash_config(nodes, vless_config, out, rules=None, chunk_size=1024):
+    """单次遍历节点，将Clash配置按块写入out（任意带write方法的对象）
     
-    # 按分类组织节点
-    categories = ["综合优选", "电信优选", "联通优选", "移动优选", "全网优选"]
-    category_nodes = {}
+    代理片段攒满chunk_size个后用join合并为一次write，内存只保留当前块
+    以及代理组所需的节点名称行。返回写入的代理数量。
+    """
+    if rules is None:
+        rules = load_clash_rules()
     
-    for node in unique_nodes:
-        try:
-            description = node.split("#")[1]
-            for category in categories:
-                if description.startswith(category):
-                    if category not in category_nodes:
-                        category_nodes[category] = []
-                    category_nodes[category].append(description)
-                    break
-        except:
-            continue
+    default_sni = vless_config.get('sni', 'knny.dpdns.org')
+    default_path = vless_config['path']
+    default_host = vless_config['domain']
     
-    with open("YXNode.yaml", "w", encoding="utf-8") as f:
-        f.write("port: 7890\n")
-        f.write("socks-port: 7891\n")
-        f.write("allow-lan: true\n")
-        f.write("mode: rule\n")
-        f.write("log-level: info\n")
-        f.write("external-controller: 127.0.0.1:9090\n")
-        f.write("proxies:\n")
-        
-        for node in unique_nodes:
-            try:
-                parts = node.split("#")
-                description = parts[1]
-                base_url = parts[0].replace("vless://", "")
-                
-                uuid_server = base_url.split("@")[0]
-                server_port = base_url.split("@")[1].split("?")[0]
-                server = server_port.split(":")[0]
-                
-                params_str = node.split("?")[1].split("#")[0]
-                params = dict(param.split("=") for param in params_str.split("&"))
-                
-                f.write(f"  - name: '{description}'\n")
-                f.write(f"    type: vless\n")
-                f.write(f"    server: {server}\n")
-                f.write(f"    port: {vless_config['port']}\n")
-                f.write(f"    uuid: {uuid_server}\n")
-                f.write(f"    cipher: none\n")
-                f.write(f"    tls: true\n")
-                f.write(f"    servername: {params.get('sni', vless_config.get('sni', 'knny.dpdns.org'))}\n")
-                f.write(f"    network: {params.get('type', 'ws')}\n")
-                f.write(f"    ws-opts:\n")
-                f.write(f"      path: \"{params.get('path', vless_config['path'])}\"\n")
-                f.write(f"      headers:\n")
-                f.write(f"        Host: {params.get('host', vless_config['domain'])}\n")
-                f.write(f"    udp: true\n\n")
-            except Exception as e:
-                print(f"生成Clash配置时跳过节点: {e}")
-                continue
-        
-        # 添加代理组
-        f.write("\nproxy-groups:\n")
-        
-        # 1. 自动选择组
-        f.write("  - name: 🚀 自动选择\n")
-        f.write("    type: url-test\n")
-        f.write("    url: http://www.gstatic.com/generate_204\n")
-        f.write("    interval: 300\n")
-        f.write("    tolerance: 50\n")
-        f.write("    lazy: true\n")
-        f.write("    proxies:\n")
-        for node in unique_nodes:
-            try:
-                description = node.split("#")[1]
-                f.write(f"      - '{description}'\n")
-            except:
-                continue
-        
-        # 2. 手动选择组
-        f.write("\n  - name: 📡 手动选择\n")
-        f.write("    type: select\n")
-        f.write("    proxies:\n")
-        f.write("      - 🚀 自动选择\n")
-        f.write("      - DIRECT\n")
-        
-        # 3. 为每个分类创建单独的代理组
-        for category in categories:
-            if category in category_nodes and category_nodes[category]:
-                f.write(f"\n  - name: {category}\n")
-                f.write("    type: select\n")
-                f.write("    proxies:\n")
-                for node_name in category_nodes[category]:
-                    f.write(f"      - '{node_name}'\n")
+    # 同一配置生成的节点共享params，port之后的片段只渲染一次
+    body_cache = {}
+    auto_names = []
+    category_names = {}
+    chunk = [CLASH_HEADER]
+    count = 0
+    
+    for node in nodes:
+        key = (node.port, node.uuid, node.params)
+        body = body_cache.get(key)
+        if body is None:
+            body = (
+                f"    port: {node.port}\n"
+                f"    uuid: {node.uuid}\n"
+                "    cipher: none\n"
+                "    tls: true\n"
+                f"    servername: {node.get_param('sni', default_sni)}\n"
+                f"    network: {node.get_param('type', 'ws')}\n"
+                "    ws-opts:\n"
+                f"      path: \"{node.get_param('path', default_path)}\"\n"
+                "      headers:\n"
+                f"        Host: {node.get_param('host', default_host)}\n"
+                "    udp: true\n\n"
+            )
+            body_cache[key] = body
         
-        # 4. 国外网站组
-        f.write("\n  - name: 🌍 国外网站\n")
-        f.write("    type: select\n")
-        f.write("    proxies:\n")
-        f.write("      - 🚀 自动选择\n")
-        f.write("      - 📡 手动选择\n")
-        for category in categories:
-            if category in category_nodes and category_nodes[category]:
-                f.write(f"      - {category}\n")
-        f.write("      - DIRECT\n")
+        chunk.append(f"  - name: '{node.description}'\n    type: vless\n    server: {node.address}\n")
+        chunk.append(body)
         
-        # 5. 全局代理组
-        f.write("\n  - name: 🎯 全局代理\n")
-        f.write("    type: select\n")
-        f.write("    proxies:\n")
-        f.write("      - 🚀 自动选择\n")
-        f.write("      - 📡 手动选择\n")
-        for category in categories:
-            if category in category_nodes and category_nodes[category]:
-                f.write(f"      - {category}\n")
-        f.write("      - DIRECT\n")
+        name_line = f"      - '{node.description}'\n"
+        auto_names.append(name_line)
+        # 分类按首次出现的顺序建组，新增数据源的分类同样会生成代理组
+        category_names.setdefault(node.category, []).append(name_line)
         
-        # 添加规则
-        f.write("\nrules:\n")
-        # 读取rules.txt文件（如果存在）
+        count += 1
+        if len(chunk) >= chunk_size:
+            out.write(''.join(chunk))
+            chunk.clear()
+    
+    active_categories = list(category_names)
+    category_refs = ''.join(f"      - {c}\n" for c in active_categories)
+    
+    def flush_lines(lines):
+        # 名称列表同样按块写出，避免拼出一个与节点数成正比的大字符串
+        out.write(''.join(chunk))
+        chunk.clear()
+        for start in range(0, len(lines), chunk_size):
+            out.write(''.join(lines[start:start + chunk_size]))
+    
+    # 添加代理组
+    # 1. 自动选择组
+    chunk.append(
+        "\nproxy-groups:\n"
+        "  - name: 🚀 自动选择\n"
+        "    type: url-test\n"
+        "    url: http://www.gstatic.com/generate_204\n"
+        "    interval: 300\n"
+        "    tolerance: 50\n"
+        "    lazy: true\n"
+        "    proxies:\n"
+    )
+    flush_lines(auto_names)
+    
+    # 2. 手动选择组
+    chunk.append(
+        "\n  - name: 📡 手动选择\n"
+        "    type: select\n"
+        "    proxies:\n"
+        "      - 🚀 自动选择\n"
+        "      - DIRECT\n"
+    )
+    
+    # 3. 为每个分类创建单独的代理组
+    for category in active_categories:
+        chunk.append(f"\n  - name: {category}\n    type: select\n    proxies:\n")
+        flush_lines(category_names[category])
+    
+    # 4. 国外网站组 / 5. 全局代理组
+    for group in ("🌍 国外网站", "🎯 全局代理"):
+        chunk.append(
+            f"\n  - name: {group}\n"
+            "    type: select\n"
+            "    proxies:\n"
+            "      - 🚀 自动选择\n"
+            "      - 📡 手动选择\n"
+        )
+        chunk.append(category_refs)
+        chunk.append("      - DIRECT\n")
+    
+    # 添加规则
+    chunk.append("\nrules:\n")
+    chunk.extend(f"{line}\n" for line in rules)
+    out.write(''.join(chunk))
+    return count
+
+def benchmark_clash_writer(sizes=(1000, 10000, 100000)):
+    """Clash配置写入性能测试"""
+    import tempfile
+    import tracemalloc
+    
+    config = get_config()
+    rules = list(DEFAULT_RULES)
+    providers = list(config.provider_names)
+    print("Clash配置写入性能测试:")
+    for size in sizes:
+        nodes = [
+            build_vless_node({'ip': f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}"},
+                             providers[i % len(providers)], i, config)
+            for i in range(size)
+        ]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "bench.yaml")
+            start = time.perf_counter()
+            with open(path, "w", encoding="utf-8", buffering=1 << 16) as f:
+                render_clash_config(nodes, config.vless, f, rules=rules)
+            elapsed = time.perf_counter() - start
+            file_size = os.path.getsize(path)
+            
+            # 单独统计峰值内存，避免tracemalloc影响计时
+            tracemalloc.start()
+            with open(path, "w", encoding="utf-8", buffering=1 << 16) as f:
+                render_clash_config(nodes, config.vless, f, rules=rules)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        print(f"  {size:>7d} 个代理: {elapsed * 1000:8.1f} ms, "
+              f"{size / elapsed:10.0f} 代理/秒, {file_size / 1024:8.0f} KB, "
+              f"峰值内存 {peak / 1024:7.0f} KB")
+
+def file_digest(path):
+    """计算文件内容的SHA-256，文件不存在时返回None"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 16), b''):
+                digest.update(block)
+    except FileNotFoundError:
+        return None
+    return digest.hexdigest()
+
+def write_if_changed(path, content):
+    """内容与现有文件不同时才写入（临时文件+原子替换），返回是否写入"""
+    data = content.encode('utf-8')
+    if hashlib.sha256(data).hexdigest() == file_digest(path):
+        return False
+    
+    directory = os.path.dirname(os.path.abspath(path))
+    tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return True
+
+def report_output_status(changed):
+    """输出文件变化状态；在GitHub Actions中同时写入步骤输出 changed=true/false"""
+    status = "changed" if changed else "unchanged"
+    print(f"OUTPUT_STATUS={status}")
+    github_output = os.environ.get('GITHUB_OUTPUT')
+    if github_output:
         try:
-            with open('rules.txt', 'r', encoding='utf-8') as rules_file:
-                for line in rules_file:
-                    line = line.strip()
-                    if line and not line.startswith('#'):
-                        f.write(f"{line}\n")
-                print("已从rules.txt加载自定义规则")
-        except FileNotFoundError:
-            print("rules.txt文件未找到，使用默认规则")
-            # 默认规则
-            f.write("  - DOMAIN-SUFFIX,openai.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,chat.openai.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,google.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,youtube.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,github.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,twitter.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,facebook.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,instagram.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,telegram.org,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,netflix.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,disneyplus.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,hulu.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,hbo.com,🌍 国外网站\n")
-            f.write("  - DOMAIN-SUFFIX,cn,DIRECT\n")
-            f.write("  - DOMAIN-KEYWORD,china,DIRECT\n")
-            f.write("  - DOMAIN-SUFFIX,taobao.com,DIRECT\n")
-            f.write("  - DOMAIN-SUFFIX,baidu.com,DIRECT\n")
-            f.write("  - DOMAIN-SUFFIX,qq.com,DIRECT\n")
-            f.write("  - DOMAIN-SUFFIX,163.com,DIRECT\n")
-            f.write("  - DOMAIN-SUFFIX,sina.com.cn,DIRECT\n")
-            f.write("  - DOMAIN-SUFFIX,weibo.com,DIRECT\n")
-            f.write("  - DOMAIN-SUFFIX,zhihu.com,DIRECT\n")
-            f.write("  - DOMAIN-SUFFIX,bilibili.com,DIRECT\n")
-            f.write("  - IP-CIDR,10.0.0.0/8,DIRECT\n")
-            f.write("  - IP-CIDR,172.16.0.0/12,DIRECT\n")
-            f.write("  - IP-CIDR,192.168.0.0/16,DIRECT\n")
-            f.write("  - IP-CIDR,127.0.0.0/8,DIRECT\n")
-            f.write("  - GEOIP,LAN,DIRECT\n")
-            f.write("  - GEOIP,CN,DIRECT\n")
-            f.write("  - MATCH,🎯 全局代理\n")
+            with open(github_output, 'a', encoding='utf-8') as f:
+                f.write(f"changed={'true' if changed else 'false'}\n")
+        except OSError as e:
+            print(f"写入GITHUB_OUTPUT失败: {e}")
 
 def check_files_exist():
     """检查输出文件是否存在且非空"""
@@ -368,9 +749,9 @@ def main():
     print(f"生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} (北京时间)")
     print("=" * 60)
     
-    config = load_config()
-    api_config = config['api_config']
-    vless_config = config['vless_config']
+    compiled = get_config()
+    vless_config = compiled.vless
+    sources = load_sources(compiled.section('ip_sources', ()), compiled.api)
     
     print(f"\n配置信息:")
     print(f"  UUID: {vless_config['uuid'][:8]}...")
@@ -382,86 +763,67 @@ def main():
     
     nodes = []
     
-    # 获取综合排名前20的IP
-    print(f"\n1. 获取综合排名前20的IP...")
-    top20_data = fetch_api_with_retry(api_config['top20_url'])
-    if top20_data and top20_data.get("code") == 0:
-        good_ips = top20_data.get("data", {}).get("good", [])
-        if good_ips:
-            print(f"   找到 {len(good_ips)} 个综合优选IP")
-            
-            for idx, ip_data in enumerate(good_ips[:20]):
-                if isinstance(ip_data, dict) and "ip" in ip_data:
-                    vless_url = generate_vless_url(ip_data, "top20", idx)
-                    if vless_url:
-                        nodes.append(vless_url)
-                        # 显示地址和描述
-                        address = get_ip_or_host(ip_data)
-                        print(f"     {idx+1:2d}. {address}")
-        else:
-            print(f"   警告: 未找到综合优选IP")
-    else:
-        print(f"   错误: 获取综合优选IP失败")
-    
-    # 获取运营商优选IP
-    print(f"\n2. 获取运营商优选IP...")
-    isp_data = fetch_api_with_retry(api_config['isp_url'])
-    if isp_data and isp_data.get("code") == 0:
-        isp_ips = isp_data.get("data", {})
-        
-        # 电信线路
-        ct_ips = isp_ips.get("CT", [])
-        if ct_ips:
-            print(f"   电信线路: {len(ct_ips)} 个IP")
-            for idx, ip_data in enumerate(ct_ips[:5]):
-                vless_url = generate_vless_url(ip_data, "CT", idx)
-                if vless_url:
-                    nodes.append(vless_url)
-                    address = get_ip_or_host(ip_data)
-                    print(f"     {idx+1:2d}. {address}")
-        else:
-            print(f"   电信线路: 未找到IP")
-        
-        # 联通线路
-        cu_ips = isp_ips.get("CU", [])
-        if cu_ips:
-            print(f"   联通线路: {len(cu_ips)} 个IP")
-            for idx, ip_data in enumerate(cu_ips[:5]):
-                vless_url = generate_vless_url(ip_data, "CU", idx)
-                if vless_url:
-                    nodes.append(vless_url)
-                    address = get_ip_or_host(ip_data)
-                    print(f"     {idx+1:2d}. {address}")
-        else:
-            print(f"   联通线路: 未找到IP")
-        
-        # 移动线路
-        cm_ips = isp_ips.get("CM", [])
-        if cm_ips:
-            print(f"   移动线路: {len(cm_ips)} 个IP")
-            for idx, ip_data in enumerate(cm_ips[:5]):
-                vless_url = generate_vless_url(ip_data, "CM", idx)
-                if vless_url:
-                    nodes.append(vless_url)
-                    address = get_ip_or_host(ip_data)
-                    print(f"     {idx+1:2d}. {address}")
-        else:
-            print(f"   移动线路: 未找到IP")
+    # 并发获取所有数据源
+    print(f"\n并发获取IP数据源...")
+    start_time = time.time()
+    cache = create_response_cache(compiled.section('cache_config'))
+    # 所有数据源共享同一个重试总时限
+    policy = RetryPolicy.from_config(compiled.section('retry_config'))
+    # 有效期内已有快照的数据源不必等待完整的重试流程，首次失败即回退到快照
+    snapshot_config = compiled.section('snapshot_config')
+    store = create_snapshot_store(snapshot_config)
+    policies = {}
+    if store:
+        fallback_policy = policy.limited(snapshot_config.get('fallback_attempts', 1))
+        policies = {source.name: fallback_policy for source in sources
+                    if store.latest(source.name)[0] is not None}
+    source_data = fetch_sources_concurrently(
+        {source.name: source.url for source in sources},
+        cache=cache, policy=policy,
+        validators={source.name: source.is_valid for source in sources},
+        policies=policies
+    )
+    print(f"  数据源获取完成，耗时 {time.time() - start_time:.2f} 秒")
+    if cache:
+        stats = cache.stats()
+        print(f"  缓存统计: 命中 {stats['hits']} (304重验证 {stats['revalidations']})，未命中 {stats['misses']}")
+    
+    # 保存快照 / 失败时回退到最近的有效快照
+    if store:
+        validators = {source.name: source.is_valid for source in sources}
+        cached = {source.name for source in sources
+                  if cache and cache.served_from_cache(source.url)}
+        source_data, fallbacks = apply_snapshot_fallback(source_data, store, validators=validators,
+                                                         cached=cached)
+        if fallbacks:
+            print(f"  ⚠️ 降级模式: {', '.join(fallbacks)} 使用了快照数据")
+    
+    # 按优先级解析各数据源，候选节点按优先级顺序进入同一个池
+    print(f"\n1. 解析IP数据源...")
+    histories = load_latency_history(compiled.section('history_config'), compiled.port)
+    if histories:
+        print(f"   已加载历史延迟: 本地探测 {len(histories['history'])} 个地址，"
+              f"客户端测速 {len(histories['client_history'])} 个地址")
+    scorer = CandidateScorer.from_config(compiled.section('scoring'), histories, get_ip_or_host)
+    for source in sources:
+        data = source_data.get(source.name)
+        if not source.is_valid(data):
+            print(f"   错误: 获取数据源 {source.name} 失败")
+            continue
         
-        # AllAvg线路
-        all_avg_ips = isp_ips.get("AllAvg", [])
-        if all_avg_ips:
-            print(f"   全网优选: {len(all_avg_ips)} 个IP")
-            for idx, ip_data in enumerate(all_avg_ips[:5]):
-                vless_url = generate_vless_url(ip_data, "AllAvg", idx)
-                if vless_url:
-                    nodes.append(vless_url)
-                    address = get_ip_or_host(ip_data)
-                    print(f"     {idx+1:2d}. {address}")
-        else:
-            print(f"   全网优选: 未找到IP")
-    else:
-        print(f"   错误: 获取运营商优选IP失败")
+        for category, items in source.extract(data):
+            if not items:
+                print(f"   {category.label}: 未找到IP")
+                continue
+            print(f"   {category.label}: {len(items)} 个IP")
+            # 按API指标评分，堆选出前limit个
+            ranked = scorer.select_top_k(items, category.limit)
+            for idx, (ip_data, score) in enumerate(ranked):
+                node = build_vless_node(ip_data, category.provider, idx, compiled)
+                if node:
+                    nodes.append(node)
+                    score_text = f"  (得分 {score:.1f})" if score is not None else ""
+                    print(f"     {idx+1:2d}. {node.address}{score_text}")
     
     # 检查是否获取到节点
     if not nodes:
@@ -471,7 +833,7 @@ def main():
     
     # 去重
     unique_nodes = get_unique_nodes(nodes)
-    print(f"\n3. 节点去重:")
+    print(f"\n2. 节点去重:")
     print(f"   原始节点数: {len(nodes)}")
     print(f"   去重后节点数: {len(unique_nodes)}")
     
@@ -481,41 +843,56 @@ def main():
         print(f"   跳过文件生成，保留现有文件")
         return False
     
+    colo_config = compiled.section('colo_config')
+    if colo_config.get('enabled', False):
+        labelled = label_nodes_with_colo(unique_nodes, colo_config, compiled)
+        print(f"   已识别数据中心: {labelled}/{len(unique_nodes)} 个节点")
+    
     # 按运营商分类显示统计
-    print(f"\n4. 节点分类统计:")
+    print(f"\n3. 节点分类统计:")
     category_count = {}
     for node in unique_nodes:
-        try:
-            description = node.split('#')[1]
-            category = description.split('-')[0]
-            category_count[category] = category_count.get(category, 0) + 1
-        except:
-            pass
+        category_count[node.category] = category_count.get(node.category, 0) + 1
     
     for category, count in category_count.items():
         print(f"   {category}: {count} 个")
     
     # 生成明文节点文件
-    print(f"\n5. 生成节点文件...")
+    # 先在内存中渲染全部输出，任何一步失败都不会改动现有文件
+    print(f"\n4. 渲染节点文件...")
     try:
-        with open("YXNode", "w", encoding="utf-8") as f:
-            for node in unique_nodes:
-                f.write(node + "\n")
+        plain_content = ''.join(f"{node.to_url()}\n" for node in unique_nodes)
     except Exception as e:
-        print(f"❌ 生成YXNode文件失败: {e}")
+        print(f"❌ 生成YXNode内容失败: {e}")
         return False
     
-    # 生成Clash配置文件
-    print(f"\n6. 生成Clash配置文件...")
+    print(f"\n5. 渲染Clash配置文件...")
     try:
-        generate_clash_config(unique_nodes, vless_config)
+        clash_buffer = io.StringIO()
+        render_clash_config(unique_nodes, vless_config, clash_buffer)
+        clash_content = clash_buffer.getvalue()
     except Exception as e:
-        print(f"❌ 生成YXNode.yaml文件失败: {e}")
-        # 如果Clash配置失败，删除已生成的YXNode文件
-        if os.path.exists("YXNode"):
-            os.remove("YXNode")
+        print(f"❌ 生成YXNode.yaml内容失败: {e}")
         return False
     
+    # 仅在内容变化时写入
+    print(f"\n6. 写入输出文件...")
+    try:
+        changed_files = [
+            path for path, content in (("YXNode", plain_content), ("YXNode.yaml", clash_content))
+            if write_if_changed(path, content)
+        ]
+    except OSError as e:
+        print(f"❌ 写入输出文件失败: {e}")
+        return False
+    
+    report_output_status(bool(changed_files))
+    if not changed_files:
+        print(f"\n✅ 节点无变化: YXNode 与 YXNode.yaml 内容相同，跳过写入")
+        print("=" * 60)
+        return True
+    print(f"   已更新: {', '.join(changed_files)}")
+    
     print(f"\n✅ 文件生成成功:")
     print(f"   YXNode - {len(unique_nodes)} 个明文节点链接")
     print(f"   YXNode.yaml - Clash配置文件")
@@ -536,6 +913,9 @@ def main():
     return True  # 返回True表示成功
 
 if __name__ == "__main__":
+    if "--benchmark-yaml" in sys.argv:
+        benchmark_clash_writer()
+        exit(0)
     success = main()
     # 根据结果返回适当的退出码
     exit(0 if success else 1)
\ No newline at end of file
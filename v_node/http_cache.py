@@ -0,0 +1,114 @@
+"""
+HTTP响应磁盘缓存
+按URL缓存响应体及校验信息（ETag / Last-Modified），支持TTL和条件请求
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    """基于磁盘的HTTP响应缓存
+
+    TTL内直接返回缓存内容；过期后由调用方发送条件请求，
+    服务端返回304时视为缓存命中并刷新获取时间。
+    """
+
+    def __init__(self, cache_dir="v_node/.cache", ttl=600):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.served = set()
+        self._lock = threading.Lock()
+
+    def _path(self, url):
+        """URL对应的缓存文件路径"""
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def get(self, url):
+        """读取缓存条目，不存在或损坏时返回None"""
+        try:
+            with open(self._path(url), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('url') != url:
+            return None
+        return entry
+
+    def is_fresh(self, entry, now=None):
+        """条目是否仍在TTL内"""
+        if not entry:
+            return False
+        now = time.time() if now is None else now
+        return now - entry.get('fetched_at', 0) < self.ttl
+
+    def conditional_headers(self, entry):
+        """根据缓存条目生成条件请求头"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """写入缓存条目（临时文件+原子替换）"""
+        entry = {
+            'url': url,
+            'body': body,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': time.time()
+        }
+        self._write(url, entry)
+        return entry
+
+    def touch(self, url, entry):
+        """304响应后刷新条目的获取时间"""
+        entry['fetched_at'] = time.time()
+        self._write(url, entry)
+        return entry
+
+    def _write(self, url, entry):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(url)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"  写入缓存失败: {e}")
+
+    def record_hit(self, url, revalidated=False):
+        with self._lock:
+            self.hits += 1
+            self.served.add(url)
+            if revalidated:
+                self.revalidations += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def served_from_cache(self, url):
+        """本次运行中该URL的数据是否来自缓存（TTL内命中或304重验证）"""
+        with self._lock:
+            return url in self.served
+
+    def stats(self):
+        """缓存命中统计"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations
+            }
@@ -0,0 +1,126 @@
+"""
+IP数据源注册表
+每个数据源在配置中声明URL、响应结构、分类映射和每个分类的数量上限，
+新增优选IP提供方只需要修改配置
+"""
+
+
+class IPCategory:
+    """数据源中的一个分类：从响应中取出列表，映射到节点运营商分类"""
+    __slots__ = ('path', 'provider', 'limit', 'label')
+
+    def __init__(self, path, provider, limit=5, label=None):
+        self.path = tuple(path.split('.')) if isinstance(path, str) else tuple(path)
+        self.provider = provider
+        self.limit = limit
+        self.label = label or provider
+
+
+class IPSource:
+    """一个优选IP数据源"""
+    __slots__ = ('name', 'url', 'priority', 'code_field', 'success_code', 'categories')
+
+    def __init__(self, name, url, categories, priority=0, code_field='code', success_code=0):
+        self.name = name
+        self.url = url
+        self.priority = priority
+        self.code_field = code_field
+        self.success_code = success_code
+        self.categories = categories
+
+    def is_valid(self, data):
+        """响应是否为成功的数据；code_field为空时只要求是JSON对象"""
+        if not isinstance(data, dict):
+            return False
+        if not self.code_field:
+            return True
+        return data.get(self.code_field) == self.success_code
+
+    def extract(self, data):
+        """按分类取出候选IP，返回 [(分类, [ip_data, ...]), ...]
+
+        列表保留完整长度（用于统计），截取由调用方按limit处理
+        """
+        results = []
+        for category in self.categories:
+            items = data
+            for key in category.path:
+                items = items.get(key, {}) if isinstance(items, dict) else {}
+            if not isinstance(items, list):
+                items = []
+            results.append((category, items))
+        return results
+
+
+# vps789 两个接口的默认结构
+DEFAULT_SOURCES = [
+    {
+        "name": "top20",
+        "url": "https://vps789.com/openApi/cfIpTop20",
+        "priority": 0,
+        "categories": [
+            {"path": "data.good", "provider": "top20", "limit": 20, "label": "综合优选"}
+        ]
+    },
+    {
+        "name": "isp",
+        "url": "https://vps789.com/openApi/cfIpApi",
+        "priority": 1,
+        "categories": [
+            {"path": "data.CT", "provider": "CT", "limit": 5, "label": "电信线路"},
+            {"path": "data.CU", "provider": "CU", "limit": 5, "label": "联通线路"},
+            {"path": "data.CM", "provider": "CM", "limit": 5, "label": "移动线路"},
+            {"path": "data.AllAvg", "provider": "AllAvg", "limit": 5, "label": "全网优选"}
+        ]
+    }
+]
+
+
+def build_source(entry):
+    """从配置项构建数据源"""
+    categories = [
+        IPCategory(item['path'], item['provider'], item.get('limit', 5), item.get('label'))
+        for item in entry.get('categories', [])
+    ]
+    return IPSource(
+        entry['name'],
+        entry['url'],
+        categories,
+        priority=entry.get('priority', 0),
+        code_field=entry.get('code_field', 'code'),
+        success_code=entry.get('success_code', 0)
+    )
+
+
+def load_sources(entries, api_config=None):
+    """从ip_sources配置项构建数据源，按优先级排序；名称重复的数据源只保留第一个
+
+    未配置ip_sources时使用vps789默认结构，URL沿用api_config中的设置
+    """
+    if not entries:
+        api_config = api_config or {}
+        urls = {
+            "top20": api_config.get('top20_url'),
+            "isp": api_config.get('isp_url')
+        }
+        entries = [dict(entry, url=urls.get(entry['name']) or entry['url'])
+                   for entry in DEFAULT_SOURCES]
+
+    sources = []
+    names = set()
+    for entry in entries:
+        if entry.get('enabled', True) is False:
+            continue
+        try:
+            source = build_source(entry)
+        except (KeyError, TypeError) as e:
+            print(f"警告: 数据源配置无效，已跳过: {entry} ({e})")
+            continue
+        # 抓取结果和快照文件都以名称为键，重名会互相覆盖
+        if source.name in names:
+            print(f"警告: 数据源名称重复，已跳过: {source.name}")
+            continue
+        names.add(source.name)
+        sources.append(source)
+    sources.sort(key=lambda source: source.priority)
+    return sources
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+延迟直方图
+HDR风格的对数分桶直方图：每个2的幂区间再均分为若干子桶，相对误差固定（默认约3%），
+计数存放在按需增长的 array 中，内存只与最大延迟有关，与样本数无关。
+直方图可以跨多次探测、多个进程合并，支持任意百分位查询，并序列化为紧凑的字节串。
+
+用法:
+    python v_node/latency_histogram.py probe_HK900.json probe_HK500.json
+    python v_node/latency_histogram.py probe_*.json -o merged_histograms.json --top 20
+"""
+
+import argparse
+import base64
+import json
+import math
+import struct
+from array import array
+
+# 延迟以微秒为单位计入，超过上限的值计入最后一个桶
+MAX_VALUE_US = 120 * 1000 * 1000
+
+
+def _encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class LatencyHistogram:
+    """对数分桶的延迟直方图
+
+    sub_bits: 每个2的幂区间的子桶数为 2^(sub_bits-1)，相对误差约 1/2^(sub_bits-1)
+    record/percentile 使用秒，与探测结果中的样本单位一致
+    """
+    __slots__ = ('sub_bits', 'counts', 'total', 'min_us', 'max_us', 'sum_us', 'sum_sq')
+
+    def __init__(self, sub_bits=6):
+        self.sub_bits = sub_bits
+        self.counts = array('I')
+        self.total = 0
+        self.min_us = None
+        self.max_us = None
+        self.sum_us = 0
+        self.sum_sq = 0.0
+
+    def _index(self, value_us):
+        sub_count = 1 << self.sub_bits
+        if value_us < sub_count:
+            return value_us
+        half = sub_count >> 1
+        exponent = value_us.bit_length() - self.sub_bits
+        return sub_count + (exponent - 1) * half + (value_us >> exponent) - half
+
+    def _bucket(self, index):
+        """桶的 (下界, 宽度)，单位微秒"""
+        sub_count = 1 << self.sub_bits
+        if index < sub_count:
+            return index, 1
+        half = sub_count >> 1
+        offset = index - sub_count
+        exponent = offset // half + 1
+        return (offset % half + half) << exponent, 1 << exponent
+
+    def record(self, seconds, count=1):
+        """计入一个耗时（秒）"""
+        value_us = min(MAX_VALUE_US, max(0, int(seconds * 1e6)))
+        index = self._index(value_us)
+        counts = self.counts
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += count
+        self.total += count
+        self.sum_us += value_us * count
+        self.sum_sq += value_us * value_us * count
+        if self.min_us is None or value_us < self.min_us:
+            self.min_us = value_us
+        if self.max_us is None or value_us > self.max_us:
+            self.max_us = value_us
+
+    def merge(self, other):
+        """把另一个直方图的计数并入本直方图"""
+        if other.sub_bits != self.sub_bits:
+            raise ValueError(f"直方图精度不一致: {self.sub_bits} != {other.sub_bits}")
+        if not other.total:
+            return self
+        counts = self.counts
+        if len(other.counts) > len(counts):
+            counts.extend([0] * (len(other.counts) - len(counts)))
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.sum_sq += other.sum_sq
+        self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+        self.max_us = other.max_us if self.max_us is None else max(self.max_us, other.max_us)
+        return self
+
+    def percentile(self, q):
+        """最近秩法百分位（秒），返回所在桶的中点，并限制在实际最小/最大值之间；没有样本时返回None"""
+        if not self.total:
+            return None
+        rank = max(1, math.ceil(self.total * q / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                low, width = self._bucket(index)
+                value = min(max(low + (width - 1) / 2, self.min_us), self.max_us)
+                return value / 1e6
+        return self.max_us / 1e6
+
+    def mean(self):
+        return self.sum_us / self.total / 1e6 if self.total else None
+
+    def summary(self):
+        """毫秒统计，字段与探测结果一致，并附带p50/p90/p99"""
+        if not self.total:
+            return None
+        return {
+            'count': self.total,
+            'min_ms': round(self.min_us / 1000, 2),
+            'p50_ms': round(self.percentile(50) * 1000, 2),
+            'p90_ms': round(self.percentile(90) * 1000, 2),
+            'p99_ms': round(self.percentile(99) * 1000, 2),
+            'max_ms': round(self.max_us / 1000, 2),
+            'mean_ms': round(self.mean() * 1000, 2)
+        }
+
+    def to_bytes(self):
+        """紧凑序列化：头部后是 (与上一个非零桶的间隔, 计数) 的varint序列"""
+        out = bytearray()
+        for value in (1, self.sub_bits, self.total, self.min_us or 0, self.max_us or 0, self.sum_us):
+            _encode_varint(value, out)
+        out += struct.pack('<d', self.sum_sq)
+        previous = -1
+        for index, count in enumerate(self.counts):
+            if count:
+                _encode_varint(index - previous, out)
+                _encode_varint(count, out)
+                previous = index
+        return bytes(out)
+
+    @classmethod
+    def from_bytes(cls, data):
+        pos = 0
+        header = []
+        for _ in range(6):
+            value, pos = _decode_varint(data, pos)
+            header.append(value)
+        version, sub_bits, total, min_us, max_us, sum_us = header
+        if version != 1:
+            raise ValueError(f"不支持的直方图版本: {version}")
+        histogram = cls(sub_bits)
+        histogram.sum_sq = struct.unpack_from('<d', data, pos)[0]
+        pos += 8
+        index = -1
+        while pos < len(data):
+            gap, pos = _decode_varint(data, pos)
+            count, pos = _decode_varint(data, pos)
+            index += gap
+            if index >= len(histogram.counts):
+                histogram.counts.extend([0] * (index + 1 - len(histogram.counts)))
+            histogram.counts[index] = count
+        histogram.total = total
+        histogram.sum_us = sum_us
+        if total:
+            histogram.min_us = min_us
+            histogram.max_us = max_us
+        return histogram
+
+    def to_text(self):
+        """Base64文本，用于写入JSON"""
+        return base64.b64encode(self.to_bytes()).decode('ascii')
+
+    @classmethod
+    def from_text(cls, text):
+        return cls.from_bytes(base64.b64decode(text))
+
+
+def merge_reports(paths):
+    """合并多个探测结果文件中每个节点的直方图，返回 {address:port: (名称, 直方图)}"""
+    merged = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            report = json.load(f)
+        for node in report.get('nodes', []):
+            text = node.get('histogram')
+            if not text:
+                continue
+            key = f"{node['address']}:{node['port']}"
+            histogram = LatencyHistogram.from_text(text)
+            if key in merged:
+                merged[key][1].merge(histogram)
+            else:
+                merged[key] = (node.get('name', key), histogram)
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="合并探测结果中的延迟直方图并查询百分位")
+    parser.add_argument('reports', nargs='+', help="probe_nodes.py输出的JSON结果")
+    parser.add_argument('-o', '--output', help="合并后的直方图JSON路径")
+    parser.add_argument('--top', type=int, default=20, help="输出p50最好的N个节点")
+    args = parser.parse_args(argv)
+
+    merged = merge_reports(args.reports)
+    ranked = sorted(merged.items(), key=lambda item: item[1][1].percentile(50))
+    samples = sum(histogram.total for _, histogram in merged.values())
+    print(f"合并 {len(args.reports)} 个结果文件: {len(merged)} 个节点，{samples} 个样本")
+    for key, (name, histogram) in ranked[:args.top]:
+        stats = histogram.summary()
+        print(f"   p50 {stats['p50_ms']:8.2f}  p90 {stats['p90_ms']:8.2f}  p99 {stats['p99_ms']:8.2f} ms  "
+              f"样本 {stats['count']:5d}  {key}  {name}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'nodes': [dict(histogram.summary(), name=name, key=key, histogram=histogram.to_text())
+                          for key, (name, histogram) in ranked]
+            }, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,240 @@
+"""
+节点延迟历史库（SQLite）
+按 address:port 维护每个节点的指数加权移动平均（EWMA）、按半衰期衰减的失败计数
+和累计的延迟直方图，供节点选择时参考多日历史，库的大小与样本数无关；
+需要原始样本时可用 keep_samples 另行追加到 samples 表。
+
+不同来源的样本分表统计：probe 为本地主动探测（TCP连接等），
+client 为Clash客户端url-test（经由代理的完整请求，明显高于连接耗时），两者不混入同一个EWMA
+
+用法:
+    python v_node/probe_nodes.py HK900 --history v_node/latency_history.db
+    python v_node/latency_history.py v_node/latency_history.db --best 20
+"""
+
+import argparse
+import math
+import sqlite3
+import time
+
+from latency_histogram import LatencyHistogram
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    address TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    latency_ms REAL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_samples_address_ts ON samples (address, ts);
+"""
+
+STATS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    address TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    ewma_ms REAL,
+    failures REAL NOT NULL DEFAULT 0,
+    samples INTEGER NOT NULL DEFAULT 0,
+    last_ts REAL NOT NULL,
+    histogram BLOB,
+    PRIMARY KEY (address, port)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_{table}_ewma ON {table} (ewma_ms);
+"""
+
+# 样本来源 → 统计表
+STATS_TABLES = {
+    'probe': 'node_stats',
+    'client': 'client_stats'
+}
+
+
+class LatencyHistory:
+    """SQLite延迟历史库
+
+    alpha: EWMA平滑系数，越大越偏重最新样本
+    failure_half_life: 失败计数的半衰期（秒）
+    keep_samples: 是否把原始样本追加到samples表，默认只更新节点统计和直方图
+    """
+
+    def __init__(self, path="v_node/latency_history.db", alpha=0.3, failure_half_life=86400.0,
+                 keep_samples=False):
+        self.path = path
+        self.alpha = alpha
+        self.failure_half_life = failure_half_life
+        self.keep_samples = keep_samples
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA + ''.join(STATS_SCHEMA.format(table=table)
+                                                 for table in STATS_TABLES.values()))
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(node_stats)")}
+        if 'histogram' not in columns:
+            # 旧版本的库没有直方图列
+            self.conn.execute("ALTER TABLE node_stats ADD COLUMN histogram BLOB")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def decay(self, failures, elapsed):
+        """失败计数按半衰期衰减"""
+        if failures <= 0 or elapsed <= 0:
+            return failures
+        return failures * math.pow(0.5, elapsed / self.failure_half_life)
+
+    def _table(self, source):
+        try:
+            return STATS_TABLES[source]
+        except KeyError:
+            raise ValueError(f"未知的样本来源: {source}") from None
+
+    def _load_stats(self, keys, table):
+        """批量读取已有的节点统计 {(address, port): [ewma, failures, samples, last_ts, 直方图]}"""
+        stats = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 400):
+            chunk = keys[start:start + 400]
+            clause = " OR ".join(["(address = ? AND port = ?)"] * len(chunk))
+            params = [value for key in chunk for value in key]
+            for address, port, ewma, failures, samples, last_ts, histogram in self.conn.execute(
+                    f"SELECT address, port, ewma_ms, failures, samples, last_ts, histogram "
+                    f"FROM {table} WHERE {clause}", params):
+                histogram = LatencyHistogram.from_bytes(histogram) if histogram else LatencyHistogram()
+                stats[(address, port)] = [ewma, failures, samples, last_ts, histogram]
+        return stats
+
+    def record_many(self, samples, source='probe'):
+        """在一个事务中计入一批样本，更新该来源的节点统计（keep_samples时同时追加原始样本）
+
+        samples: 可迭代的 (address, port, ts, latency_ms或None)，None表示失败。
+        不晚于节点已有last_ts的样本会被跳过：EWMA只按时间顺序前进，重复导入也不会重复计数。
+        返回实际计入的样本数
+        """
+        table = self._table(source)
+        rows = sorted(((address, int(port), ts, latency) for address, port, ts, latency in samples),
+                      key=lambda row: row[2])
+        if not rows:
+            return 0
+        stats = self._load_stats({(row[0], row[1]) for row in rows}, table)
+        stored_last = {key: entry[3] for key, entry in stats.items()}
+        rows = [row for row in rows if row[2] > stored_last.get((row[0], row[1]), -math.inf)]
+        for address, port, ts, latency in rows:
+            entry = stats.get((address, port))
+            if entry is None:
+                entry = stats[(address, port)] = [None, 0.0, 0, ts, LatencyHistogram()]
+            ewma, failures, count, last_ts, histogram = entry
+            failures = self.decay(failures, ts - last_ts)
+            if latency is None:
+                failures += 1
+            else:
+                histogram.record(latency / 1000)
+                if ewma is None:
+                    ewma = latency
+                else:
+                    ewma = self.alpha * latency + (1 - self.alpha) * ewma
+            entry[:4] = [ewma, failures, count + 1, max(ts, last_ts)]
+
+        with self.conn:
+            if self.keep_samples:
+                self.conn.executemany(
+                    "INSERT INTO samples (address, port, ts, latency_ms, ok) VALUES (?, ?, ?, ?, ?)",
+                    ((address, port, ts, latency, latency is not None)
+                     for address, port, ts, latency in rows))
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO {table} "
+                "(address, port, ewma_ms, failures, samples, last_ts, histogram) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((address, port, ewma, failures, count, last_ts, histogram.to_bytes())
+                 for (address, port), (ewma, failures, count, last_ts, histogram) in stats.items()))
+        return len(rows)
+
+    def best(self, n, max_failures=3.0, now=None, source='probe'):
+        """按该来源的EWMA升序返回前n个节点，跳过衰减后失败计数超过max_failures的节点
+
+        返回 [{'address', 'port', 'ewma_ms', 'failures', 'samples', 'last_ts', 'p50_ms', 'p90_ms', 'p99_ms'}, ...]
+        """
+        now = time.time() if now is None else now
+        results = []
+        cursor = self.conn.execute(
+            "SELECT address, port, ewma_ms, failures, samples, last_ts, histogram "
+            f"FROM {self._table(source)} WHERE ewma_ms IS NOT NULL ORDER BY ewma_ms")
+        for address, port, ewma, failures, samples, last_ts, histogram in cursor:
+            failures = self.decay(failures, now - last_ts)
+            if failures > max_failures:
+                continue
+            node = {
+                'address': address,
+                'port': port,
+                'ewma_ms': round(ewma, 2),
+                'failures': round(failures, 3),
+                'samples': samples,
+                'last_ts': last_ts
+            }
+            if histogram:
+                histogram = LatencyHistogram.from_bytes(histogram)
+                for q in (50, 90, 99):
+                    node[f'p{q}_ms'] = round(histogram.percentile(q) * 1000, 2)
+            results.append(node)
+            if len(results) >= n:
+                break
+        cursor.close()
+        return results
+
+    def ewma_map(self, port=None, max_failures=3.0, now=None, source='probe'):
+        """返回该来源的 {address: ewma_ms}，可按端口过滤，失败过多的节点不包含在内"""
+        now = time.time() if now is None else now
+        query = (f"SELECT address, ewma_ms, failures, last_ts FROM {self._table(source)} "
+                 "WHERE ewma_ms IS NOT NULL")
+        params = ()
+        if port is not None:
+            query += " AND port = ?"
+            params = (int(port),)
+        return {
+            address: ewma
+            for address, ewma, failures, last_ts in self.conn.execute(query, params)
+            if self.decay(failures, now - last_ts) <= max_failures
+        }
+
+    def prune(self, max_age, now=None):
+        """删除早于max_age秒的原始样本（节点统计和直方图保留），返回删除条数"""
+        now = time.time() if now is None else now
+        with self.conn:
+            cursor = self.conn.execute("DELETE FROM samples WHERE ts < ?", (now - max_age,))
+        return cursor.rowcount
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="节点延迟历史查询")
+    parser.add_argument('db', nargs='?', default="v_node/latency_history.db", help="历史库路径")
+    parser.add_argument('--best', type=int, default=20, help="输出EWMA最好的N个节点")
+    parser.add_argument('--max-failures', type=float, default=3.0, help="允许的衰减后失败计数")
+    parser.add_argument('--prune-days', type=float, help="删除早于N天的原始样本")
+    parser.add_argument('--source', choices=sorted(STATS_TABLES), default='probe',
+                        help="样本来源：probe 本地探测，client Clash客户端url-test")
+    args = parser.parse_args(argv)
+
+    with LatencyHistory(args.db) as history:
+        if args.prune_days:
+            removed = history.prune(args.prune_days * 86400)
+            print(f"已删除 {removed} 条过期样本")
+        nodes = history.best(args.best, args.max_failures, source=args.source)
+        print(f"EWMA最好的 {len(nodes)} 个节点:")
+        for index, node in enumerate(nodes, 1):
+            percentiles = ""
+            if 'p50_ms' in node:
+                percentiles = f"  p50/p90/p99 {node['p50_ms']:.1f}/{node['p90_ms']:.1f}/{node['p99_ms']:.1f}"
+            print(f"   {index:2d}. {node['ewma_ms']:8.2f} ms  失败 {node['failures']:.2f}  "
+                  f"样本 {node['samples']:5d}{percentiles}  {node['address']}:{node['port']}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
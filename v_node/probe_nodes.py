@@ -0,0 +1,1115 @@
+#!/usr/bin/env python3
+"""
+节点延迟探测
+读取明文或Base64订阅格式的节点文件（YXNode、HK900等），
+用asyncio并发探测每个节点的 address:port，结果写入JSON
+
+探测方式:
+    tcp  TCP连接耗时
+    tls  TCP连接 + TLS握手耗时（使用节点的sni与alpn参数）
+    ws   在tls基础上发送WebSocket升级请求（使用节点的host与path参数），记录收到101的耗时
+
+用法:
+    python v_node/probe_nodes.py HK900 -o probe_HK900.json
+    python v_node/probe_nodes.py YXNode -m tls
+    python v_node/probe_nodes.py YXNode -m ws
+    python v_node/probe_nodes.py YXNode --stability -n 10 --window 60 --sorted-output YXNode.stable
+    python v_node/probe_nodes.py HK900 --adaptive 20 -n 10
+    python v_node/probe_nodes.py --benchmark-adaptive
+    python v_node/probe_nodes.py HK900 --top-k 20 --threshold 200
+    python v_node/probe_nodes.py HK900 -m tls --workers 4
+    python v_node/probe_nodes.py --benchmark-workers
+    python v_node/probe_nodes.py HK900 --rate 500 --subnet-rate 20
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import bisect
+import hashlib
+import heapq
+import json
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+from latency_histogram import LatencyHistogram
+from latency_history import LatencyHistory
+from probe_pacing import ProbePacer
+
+
+class ProbeTarget:
+    """从节点链接中解析出的探测目标"""
+    __slots__ = ('name', 'address', 'port', 'params', 'line')
+
+    def __init__(self, name, address, port, params, line):
+        self.name = name
+        self.address = address
+        self.port = port
+        self.params = params
+        self.line = line
+
+    @property
+    def key(self):
+        return f"{self.address}:{self.port}"
+
+    @property
+    def sni(self):
+        return self.params.get('sni') or self.params.get('host') or self.address
+
+    @property
+    def host(self):
+        return self.params.get('host') or self.sni
+
+    @property
+    def path(self):
+        return self.params.get('path') or '/'
+
+    @property
+    def use_tls(self):
+        return self.params.get('security', 'tls') == 'tls'
+
+    @property
+    def alpn(self):
+        """ALPN列表，如 ('h2', 'http/1.1')；未设置时为空元组"""
+        value = self.params.get('alpn', '')
+        return tuple(item for item in value.split(',') if item)
+
+    def __repr__(self):
+        return f"ProbeTarget({self.key!r})"
+
+
+def parse_node_line(line):
+    """解析一行 vless://uuid@address:port?params#name，无法解析时返回None"""
+    line = line.strip()
+    if not line or '://' not in line:
+        return None
+    try:
+        parts = urlsplit(line)
+        address = parts.hostname
+        port = parts.port or 443
+    except ValueError:
+        return None
+    if not address:
+        return None
+    params = dict(parse_qsl(parts.query, keep_blank_values=True))
+    name = unquote(parts.fragment) if parts.fragment else f"{address}:{port}"
+    return ProbeTarget(name, address, port, params, line)
+
+
+def decode_subscription(text):
+    """Base64订阅内容解码为明文，已是明文时原样返回"""
+    if '://' in text:
+        return text
+    compact = ''.join(text.split())
+    try:
+        padded = compact + '=' * (-len(compact) % 4)
+        return base64.b64decode(padded).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        return text
+
+
+def read_node_file(path):
+    """读取节点文件，返回去重后的探测目标列表（保持文件顺序）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = decode_subscription(f.read())
+    targets = []
+    seen = set()
+    for line in text.splitlines():
+        target = parse_node_line(line)
+        if target and target.key not in seen:
+            seen.add(target.key)
+            targets.append(target)
+    return targets
+
+
+def summarize_histogram(histogram):
+    """汇总某个阶段的延迟直方图，返回毫秒统计"""
+    if histogram is None or not histogram.total:
+        return None
+    return {
+        'min_ms': round(histogram.min_us / 1000, 2),
+        'median_ms': round(histogram.percentile(50) * 1000, 2),
+        'p95_ms': round(histogram.percentile(95) * 1000, 2)
+    }
+
+
+class _ProbeProtocol(asyncio.Protocol):
+    """最小化的连接协议：缓存收到的数据，供TLS/HTTP探测读取"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.waiter = None
+        self.closed = None
+
+    def connection_made(self, transport):
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def data_received(self, data):
+        self.buffer += data
+        self._wake()
+
+    def eof_received(self):
+        self._wake()
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(exc)
+        self._wake()
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def read_until(self, marker, limit=65536):
+        """读取直到出现marker，返回marker之前（含marker）的数据"""
+        while True:
+            index = self.buffer.find(marker)
+            if index >= 0:
+                end = index + len(marker)
+                data = bytes(self.buffer[:end])
+                del self.buffer[:end]
+                return data
+            if self.closed.done():
+                raise ConnectionResetError("连接已关闭")
+            if len(self.buffer) > limit:
+                raise ValueError("响应头过长")
+            self.waiter = asyncio.get_running_loop().create_future()
+            await self.waiter
+
+
+class ProbeTimeout(asyncio.TimeoutError):
+    """某个阶段（tls/upgrade等）超时"""
+
+    def __init__(self, stage):
+        super().__init__(f"{stage} 超时")
+        self.stage = stage
+
+
+_ssl_contexts = {}
+
+
+def get_ssl_context(alpn=(), verify=False):
+    """按 (ALPN, 是否校验证书) 缓存SSL上下文，所有探测复用"""
+    key = (alpn, verify)
+    context = _ssl_contexts.get(key)
+    if context is None:
+        context = ssl.create_default_context()
+        if not verify:
+            # 节点普遍使用 allowInsecure=1，默认不校验证书
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        if alpn:
+            context.set_alpn_protocols(list(alpn))
+        _ssl_contexts[key] = context
+    return context
+
+
+async def open_probe_connection(target, timeout):
+    """建立TCP连接，返回 (transport, protocol, 连接耗时)"""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    transport, protocol = await asyncio.wait_for(
+        loop.create_connection(_ProbeProtocol, target.address, target.port), timeout)
+    return transport, protocol, time.perf_counter() - start
+
+
+async def start_probe_tls(transport, protocol, target, timeout, options):
+    """在已建立的连接上完成TLS握手，返回 (TLS transport, 握手耗时)"""
+    loop = asyncio.get_running_loop()
+    context = get_ssl_context(target.alpn, options.get('verify', False))
+    start = time.perf_counter()
+    try:
+        tls_transport = await asyncio.wait_for(
+            loop.start_tls(transport, protocol, context, server_hostname=target.sni), timeout)
+    except asyncio.TimeoutError:
+        raise ProbeTimeout('tls') from None
+    return tls_transport, time.perf_counter() - start
+
+
+async def probe_tcp(target, timeout, options):
+    """TCP连接耗时"""
+    transport, _, connect = await open_probe_connection(target, timeout)
+    transport.close()
+    return {'total': connect, 'connect': connect}
+
+
+async def probe_tls(target, timeout, options):
+    """TCP连接 + TLS握手耗时（使用节点自身的SNI与ALPN）"""
+    deadline = time.perf_counter() + timeout
+    transport, protocol, connect = await open_probe_connection(target, timeout)
+    try:
+        transport, handshake = await start_probe_tls(
+            transport, protocol, target, max(0.001, deadline - time.perf_counter()), options)
+    finally:
+        transport.close()
+    return {'total': connect + handshake, 'connect': connect, 'tls': handshake}
+
+
+WS_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class ProbeHTTPError(Exception):
+    """WebSocket升级未返回101"""
+
+    def __init__(self, status, reason=''):
+        super().__init__(f"HTTP {status} {reason}".strip())
+        self.status = status
+
+
+def build_ws_request(target, key):
+    """构造WebSocket升级请求"""
+    return (
+        f"GET {target.path} HTTP/1.1\r\n"
+        f"Host: {target.host}\r\n"
+        "Upgrade: websocket\r\n"
+        "Connection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\n"
+        "Sec-WebSocket-Version: 13\r\n"
+        "User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36\r\n"
+        "\r\n"
+    ).encode('ascii')
+
+
+def check_ws_response(head, key):
+    """校验升级响应：状态码必须为101且Sec-WebSocket-Accept正确"""
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ', 2)
+    if len(parts) < 2 or not parts[1].isdigit():
+        raise ProbeHTTPError(0, 'invalid status line')
+    status = int(parts[1])
+    if status != 101:
+        raise ProbeHTTPError(status, parts[2] if len(parts) > 2 else '')
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    expected = base64.b64encode(hashlib.sha1(key.encode('ascii') + WS_GUID).digest()).decode('ascii')
+    if headers.get('sec-websocket-accept') != expected:
+        raise ProbeHTTPError(101, 'bad Sec-WebSocket-Accept')
+
+
+async def probe_ws(target, timeout, options):
+    """TCP连接 + TLS握手 + WebSocket升级，分别计时"""
+    deadline = time.perf_counter() + timeout
+    transport, protocol, connect = await open_probe_connection(target, timeout)
+    timings = {'connect': connect}
+    try:
+        if target.use_tls:
+            # WebSocket升级只能走HTTP/1.1，ALPN固定为http/1.1
+            ws_target = ProbeTarget(target.name, target.address, target.port,
+                                    dict(target.params, alpn='http/1.1'), target.line)
+            transport, timings['tls'] = await start_probe_tls(
+                transport, protocol, ws_target, max(0.001, deadline - time.perf_counter()), options)
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        start = time.perf_counter()
+        transport.write(build_ws_request(target, key))
+        try:
+            head = await asyncio.wait_for(protocol.read_until(b"\r\n\r\n"),
+                                          max(0.001, deadline - time.perf_counter()))
+        except asyncio.TimeoutError:
+            raise ProbeTimeout('upgrade') from None
+        timings['upgrade'] = time.perf_counter() - start
+        check_ws_response(head, key)
+    finally:
+        transport.close()
+    timings['total'] = sum(timings.values())
+    return timings
+
+
+PROBE_MODES = {
+    'tcp': probe_tcp,
+    'tls': probe_tls,
+    'ws': probe_ws
+}
+
+
+def classify_error(error):
+    """把探测异常归类为简短的错误类型"""
+    if isinstance(error, ProbeTimeout):
+        return f"{error.stage}_timeout"
+    if isinstance(error, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(error, ProbeHTTPError):
+        return f"http_{error.status}"
+    if isinstance(error, ConnectionRefusedError):
+        return 'refused'
+    if isinstance(error, ssl.SSLError):
+        return 'tls'
+    if isinstance(error, OSError):
+        return 'network'
+    return type(error).__name__
+
+
+class ProbeResult:
+    """单个节点的探测结果
+
+    每个阶段的耗时在到达时计入该阶段的LatencyHistogram，内存与样本数无关；
+    keep_samples为True时另按顺序保留总耗时样本，供需要样本顺序的模式使用
+    （稳定性模式计算抖动、top-K模式计算中位数）
+    """
+    __slots__ = ('target', 'histograms', 'samples', 'attempts', 'errors')
+
+    def __init__(self, target, keep_samples=False):
+        self.target = target
+        self.histograms = {}
+        self.samples = [] if keep_samples else None
+        self.attempts = 0
+        self.errors = {}
+
+    def add_sample(self, timings):
+        self.attempts += 1
+        for phase, seconds in timings.items():
+            histogram = self.histograms.get(phase)
+            if histogram is None:
+                histogram = self.histograms[phase] = LatencyHistogram()
+            histogram.record(seconds)
+        if self.samples is not None:
+            self.samples.append(timings['total'])
+
+    def add_error(self, kind):
+        self.attempts += 1
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    @property
+    def successes(self):
+        histogram = self.histograms.get('total')
+        return histogram.total if histogram else 0
+
+    def to_dict(self):
+        total = summarize_histogram(self.histograms.get('total'))
+        result = {
+            'name': self.target.name,
+            'address': self.target.address,
+            'port': self.target.port,
+            'ok': self.successes > 0,
+            'success': self.successes,
+            'attempts': self.attempts
+        }
+        if total:
+            result.update(total)
+            # 紧凑直方图，可用 latency_histogram.py 跨多次探测合并
+            result['histogram'] = self.histograms['total'].to_text()
+        phases = {phase: summarize_histogram(histogram)
+                  for phase, histogram in self.histograms.items() if phase != 'total'}
+        if phases:
+            result['phases'] = phases
+        if self.errors:
+            result['errors'] = dict(self.errors)
+        return result
+
+
+def make_sampler(mode, timeout, options, semaphore):
+    """返回执行单次探测并把结果记入ProbeResult的协程函数
+
+    options['recorder'] 为列表时，每个样本追加 (address, port, 时间戳, 延迟ms或None)；
+    options['probe'] 可替换探测函数（基准测试中使用模拟探测）；
+    options['pacer'] 为ProbePacer时，每次探测前按全局和网段速率等待
+    """
+    probe = options.get('probe') or PROBE_MODES[mode]
+    recorder = options.get('recorder')
+    pacer = options.get('pacer')
+
+    async def one_sample(result, on_start=None):
+        # 在占用并发名额之前限速，同一网段排队时不会占住其他网段的名额
+        if pacer is not None:
+            await pacer.acquire(result.target)
+        async with semaphore:
+            if on_start is not None:
+                on_start()
+            target = result.target
+            try:
+                timings = await probe(target, timeout, options)
+            except Exception as e:
+                result.add_error(classify_error(e))
+                if recorder is not None:
+                    recorder.append((target.address, target.port, time.time(), None))
+            else:
+                result.add_sample(timings)
+                if recorder is not None:
+                    recorder.append((target.address, target.port, time.time(), timings['total'] * 1000))
+
+    return one_sample
+
+
+async def run_probes(targets, mode='tcp', samples=3, concurrency=200, timeout=3.0, options=None):
+    """并发探测所有目标，每个样本是一个独立任务，由信号量限制并发数
+
+    返回与targets顺序一致的ProbeResult列表
+    """
+    results = [ProbeResult(target) for target in targets]
+    one_sample = make_sampler(mode, timeout, options or {}, asyncio.Semaphore(concurrency))
+
+    # 按轮次交错提交样本，避免同一节点的样本挤在一起
+    await asyncio.gather(*(one_sample(result)
+                           for _ in range(samples) for result in results))
+    return results
+
+
+async def run_stability_probes(targets, mode='tcp', rounds=10, window=60.0, concurrency=200,
+                               timeout=3.0, options=None, seed=None):
+    """稳定性探测：rounds轮样本均匀分布在window秒内
+
+    每一轮所有节点各探测一次，且每轮随机打乱顺序，
+    使本地的瞬时拥塞不会总是落在同一个节点上。样本按轮次顺序记录，用于计算抖动。
+    """
+    results = [ProbeResult(target, keep_samples=True) for target in targets]
+    one_sample = make_sampler(mode, timeout, options or {}, asyncio.Semaphore(concurrency))
+    rng = random.Random(seed)
+    interval = window / rounds if rounds > 0 else 0
+    start = time.perf_counter()
+
+    for round_index in range(rounds):
+        order = list(results)
+        rng.shuffle(order)
+        await asyncio.gather(*(one_sample(result) for result in order))
+        next_start = start + (round_index + 1) * interval
+        delay = next_start - time.perf_counter()
+        if delay > 0 and round_index < rounds - 1:
+            await asyncio.sleep(delay)
+    return results
+
+
+def _probe_worker(conn, shard, mode, samples, concurrency, timeout, options):
+    """子进程：用独立的事件循环探测一个分片，每个节点完成后立即通过管道发回结果
+
+    与 run_probes 一样按轮次交错提交样本，单进程与多进程模式的测量方式一致。
+    shard: [(全局序号, 节点链接行), ...]；发送 (序号, 各阶段直方图, attempts, errors, 历史样本)，结束时发送None
+    """
+    recorder = [] if options.pop('record', False) else None
+    if recorder is not None:
+        options['recorder'] = recorder
+
+    async def run():
+        one_sample = make_sampler(mode, timeout, options, asyncio.Semaphore(concurrency))
+        results = [(index, ProbeResult(parse_node_line(line))) for index, line in shard]
+        remaining = {index: samples for index, _ in results}
+
+        async def sample(index, result):
+            await one_sample(result)
+            remaining[index] -= 1
+            if remaining[index]:
+                return
+            # 历史样本按到达顺序随完成的节点一起发回
+            records = []
+            if recorder:
+                records = recorder[:]
+                recorder.clear()
+            conn.send((index, result.histograms, result.attempts, result.errors, records))
+
+        await asyncio.gather(*(sample(index, result)
+                               for _ in range(samples) for index, result in results))
+
+    try:
+        asyncio.run(run())
+    finally:
+        conn.send(None)
+        conn.close()
+
+
+def run_sharded_probes(targets, workers=4, mode='tcp', samples=3, concurrency=200, timeout=3.0,
+                       options=None):
+    """把节点交错分片到workers个子进程，每个进程有自己的事件循环和并发上限concurrency
+
+    大量TLS握手时单个事件循环会先被CPU限制，分片后吞吐量随CPU核数增长。
+    子进程逐个节点回传结果，合并后返回与targets顺序一致的ProbeResult列表
+    """
+    options = dict(options or {})
+    recorder = options.pop('recorder', None)
+    options['record'] = recorder is not None
+    if options.get('pacer') is not None:
+        # 每个进程各自限速，速率平分
+        options['pacer'] = options['pacer'].split(workers)
+    results = [ProbeResult(target) for target in targets]
+
+    connections = []
+    processes = []
+    for worker in range(workers):
+        shard = [(index, targets[index].line) for index in range(worker, len(targets), workers)]
+        if not shard:
+            continue
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        process = multiprocessing.Process(
+            target=_probe_worker,
+            args=(sender, shard, mode, samples, concurrency, timeout, dict(options)),
+            daemon=True)
+        process.start()
+        sender.close()
+        connections.append(receiver)
+        processes.append(process)
+
+    while connections:
+        for conn in multiprocessing.connection.wait(connections):
+            try:
+                message = conn.recv()
+            except EOFError:
+                message = None
+            if message is None:
+                connections.remove(conn)
+                conn.close()
+                continue
+            index, histograms, attempts, errors, records = message
+            result = results[index]
+            result.histograms = histograms
+            result.attempts = attempts
+            result.errors = errors
+            if recorder is not None:
+                recorder.extend(records)
+
+    for process in processes:
+        process.join()
+    return results
+
+
+def adaptive_estimate(result, penalty_ms, z=2.0, floor_ratio=0.02):
+    """自适应模式下节点的延迟估计与置信区间，返回 (均值, 下界, 上界)，单位ms
+
+    失败样本按penalty_ms（超时时间）计入，使经常失败的节点自然排到后面；
+    标准差设下限，避免少量相同样本被误判为完全确定。
+    均值和方差由直方图中累计的和与平方和得出，不需要保留原始样本
+    """
+    histogram = result.histograms.get('total')
+    successes = histogram.total if histogram else 0
+    sum_ms = histogram.sum_us / 1000 if histogram else 0.0
+    sum_sq = histogram.sum_sq / 1e6 if histogram else 0.0
+    failures = result.attempts - successes
+    n = result.attempts
+    mean = (sum_ms + failures * penalty_ms) / n
+    if n > 1:
+        squares = sum_sq + failures * penalty_ms ** 2 - n * mean * mean
+        std = math.sqrt(max(0.0, squares) / (n - 1))
+    else:
+        std = penalty_ms
+    half = z * max(std, floor_ratio * mean, 0.5) / math.sqrt(n)
+    return mean, mean - half, mean + half
+
+
+async def run_adaptive_probes(targets, mode='tcp', k=20, initial=2, max_samples=10, concurrency=200,
+                              timeout=3.0, options=None, z=2.0):
+    """自适应探测（top-K 逐轮淘汰）：只给排名仍不确定的节点追加样本
+
+    每个节点先探测initial次，之后每轮根据置信区间判断：
+    - 至少有K个节点的上界低于它的下界 → 确定落选，停止探测
+    - 可能比它更好的节点（下界低于它的上界）少于K个 → 确定入选，停止探测
+    - 其余节点的区间跨越第K名的分界线，再各追加一个样本
+    直到选满K个、没有待定节点或待定节点都达到max_samples。
+
+    返回 (与targets顺序一致的ProbeResult列表, 入选的K个ProbeResult（按估计延迟升序）)
+    """
+    results = [ProbeResult(target) for target in targets]
+    one_sample = make_sampler(mode, timeout, options or {}, asyncio.Semaphore(concurrency))
+    penalty_ms = timeout * 1000
+    if not results or k <= 0:
+        return results, []
+
+    await asyncio.gather(*(one_sample(result)
+                           for _ in range(min(initial, max_samples)) for result in results))
+    accepted = []
+    active = results
+    while True:
+        contenders = accepted + active
+        estimates = {id(result): adaptive_estimate(result, penalty_ms, z) for result in contenders}
+        if len(contenders) <= k:
+            accepted, active = contenders, []
+            break
+        lower = sorted(estimate[1] for estimate in estimates.values())
+        upper = sorted(estimate[2] for estimate in estimates.values())
+        undecided = []
+        for result in active:
+            _, low, high = estimates[id(result)]
+            if bisect.bisect_left(upper, low) >= k:
+                continue
+            # 减去自身的下界
+            if bisect.bisect_left(lower, high) - 1 < k:
+                accepted.append(result)
+            else:
+                undecided.append(result)
+        active = undecided
+        if len(accepted) >= k:
+            break
+        active = [result for result in undecided if result.attempts < max_samples]
+        if not active:
+            active = undecided
+            break
+        await asyncio.gather(*(one_sample(result) for result in active))
+
+    # 样本用完仍待定时，按估计延迟补足K个
+    pool = accepted + active
+    pool.sort(key=lambda result: adaptive_estimate(result, penalty_ms, z)[0])
+    return results, pool[:k]
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+async def run_top_k_probes(targets, mode='tcp', k=20, threshold_ms=None, samples=3, concurrency=200,
+                           timeout=3.0, options=None, check_interval=0.01):
+    """提前结束的top-K探测：只关心最好的K个节点时，不必等待慢节点和超时节点
+
+    每个节点依次探测samples次，得分为中位延迟（失败样本按超时时间计）。
+    完成且得分低于threshold_ms的节点进入容量为K的最大堆；
+    堆满后，得分下界不低于第K名的未完成节点会被取消（包括正在进行的探测），
+    所有节点完成或被取消后结束。
+    未完成节点的下界：已完成样本 + 正在进行的样本（至少已等待的时长）+ 未开始的样本（按0计）的中位数；
+    尚未开始探测的节点下界为0，因此一定会被探测到。
+
+    返回 (与targets顺序一致的ProbeResult列表, [(ProbeResult, 得分ms), ...]按得分升序, 被取消的节点数)
+    """
+    results = [ProbeResult(target, keep_samples=True) for target in targets]
+    if not results or k <= 0:
+        return results, [], 0
+    one_sample = make_sampler(mode, timeout, options or {}, asyncio.Semaphore(concurrency))
+    penalty_ms = timeout * 1000
+    limit = math.inf if threshold_ms is None else threshold_ms
+    started = {}
+    winners = []
+
+    def finished_values(result):
+        values = [seconds * 1000 for seconds in result.samples]
+        values += [penalty_ms] * (result.attempts - len(values))
+        return values
+
+    def lower_bound(index, now):
+        values = finished_values(results[index])
+        start = started.get(index)
+        if start is not None:
+            values.append(min((now - start) * 1000, penalty_ms))
+        values += [0.0] * (samples - len(values))
+        return median(values)
+
+    async def race(index, result):
+        def mark():
+            started[index] = time.perf_counter()
+        for _ in range(samples):
+            await one_sample(result, mark)
+            started.pop(index, None)
+        score = median(finished_values(result))
+        if score < limit:
+            item = (-score, index)
+            if len(winners) < k:
+                heapq.heappush(winners, item)
+            elif item > winners[0]:
+                heapq.heapreplace(winners, item)
+
+    tasks = {index: asyncio.create_task(race(index, result)) for index, result in enumerate(results)}
+    cancelled = 0
+    while tasks:
+        done, _ = await asyncio.wait(tasks.values(), timeout=check_interval)
+        for index in [index for index, task in tasks.items() if task in done]:
+            del tasks[index]
+        if len(winners) < k:
+            continue
+        kth = -winners[0][0]
+        now = time.perf_counter()
+        hopeless = [index for index in tasks if lower_bound(index, now) >= kth]
+        for index in hopeless:
+            tasks.pop(index).cancel()
+        cancelled += len(hopeless)
+
+    ranked = sorted((-negative, index) for negative, index in winners)
+    return results, [(results[index], score) for score, index in ranked], cancelled
+
+
+def stability_metrics(result, jitter_weight=2.0):
+    """计算抖动（相邻样本差的绝对值均值）、失败率和稳定性得分
+
+    得分 = (中位延迟 + jitter_weight × 抖动) / 成功率，越低越稳定；
+    可以理解为每获得一次成功连接的期望代价
+    """
+    values = result.samples or []
+    attempts = result.attempts
+    failure_rate = 1 - len(values) / attempts if attempts else 1.0
+    metrics = {'failure_rate': round(failure_rate, 4)}
+    if not values:
+        return metrics
+    jitter = 0.0
+    if len(values) >= 2:
+        jitter = sum(abs(b - a) for a, b in zip(values, values[1:])) / (len(values) - 1)
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    median = ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+    metrics['jitter_ms'] = round(jitter * 1000, 2)
+    metrics['stability_score'] = round((median + jitter_weight * jitter) * 1000 / (1 - failure_rate), 2)
+    return metrics
+
+
+def sort_results(results, stability=False, jitter_weight=2.0):
+    """可达节点在前，不可达节点在后；普通模式按中位延迟升序，稳定性模式按稳定性得分升序"""
+    nodes = []
+    for result in results:
+        node = result.to_dict()
+        if stability:
+            node.update(stability_metrics(result, jitter_weight))
+        nodes.append(node)
+    sort_key = 'stability_score' if stability else 'median_ms'
+    return sorted(nodes, key=lambda r: (not r['ok'], r.get(sort_key, float('inf'))))
+
+
+def write_sorted_node_file(nodes, targets, output_file, drop_failed=False):
+    """按排序结果重新输出节点文件（原始链接行）"""
+    lines = {target.key: target.line for target in targets}
+    with open(output_file, 'w', encoding='utf-8') as f:
+        for node in nodes:
+            if drop_failed and not node['ok']:
+                continue
+            line = lines.get(f"{node['address']}:{node['port']}")
+            if line:
+                f.write(line + "\n")
+
+
+def write_report(report, output_file):
+    """写入JSON结果（临时文件+原子替换）"""
+    tmp_path = f"{output_file}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, output_file)
+
+
+def simulate_nodes(count=947, dead_ratio=0.3, time_scale=1.0, seed=1):
+    """生成模拟节点和对应的模拟探测函数，供基准测试使用
+
+    每个模拟节点有固定的基础延迟（对数正态分布）和10%的抖动，dead_ratio比例的节点总是超时；
+    模拟探测按 time_scale 缩短实际等待时间，记录的延迟按比例还原
+    返回 (targets, {key: 基础延迟ms或None}, 探测函数)
+    """
+    rng = random.Random(seed)
+    profiles = {}
+    targets = []
+    for index in range(count):
+        target = ProbeTarget(f"sim{index:04d}", f"10.0.{index // 256}.{index % 256}", 443, {}, '')
+        base = None if rng.random() < dead_ratio else rng.lognormvariate(math.log(150), 0.5)
+        profiles[target.key] = base
+        targets.append(target)
+
+    async def simulated_probe(target, timeout, options):
+        base = profiles[target.key]
+        if base is None:
+            await asyncio.sleep(timeout * time_scale)
+            raise asyncio.TimeoutError()
+        start = time.perf_counter()
+        await asyncio.sleep(max(1.0, rng.gauss(base, base * 0.1)) / 1000 * time_scale)
+        # 与真实探测一样记录实际等待时长（含事件循环的调度延迟）
+        latency = (time.perf_counter() - start) / time_scale
+        return {'total': latency, 'connect': latency}
+
+    return targets, profiles, simulated_probe
+
+
+def benchmark_adaptive(count=947, k=20, samples=10, concurrency=200, timeout=1.0,
+                       dead_ratio=0.3, time_scale=0.1, seed=1):
+    """用模拟延迟对比穷举探测与自适应探测的探测次数、耗时和top-K一致性"""
+    targets, profiles, simulated_probe = simulate_nodes(count, dead_ratio, time_scale, seed)
+    options = {'probe': simulated_probe}
+    truth = {key for key, _ in sorted(((key, base) for key, base in profiles.items() if base is not None),
+                                      key=lambda item: item[1])[:k]}
+
+    start = time.perf_counter()
+    results = asyncio.run(run_probes(targets, 'tcp', samples, concurrency, timeout, options))
+    exhaustive_time = time.perf_counter() - start
+    exhaustive_probes = sum(result.attempts for result in results)
+    exhaustive = {node['address'] + ':' + str(node['port']) for node in sort_results(results)[:k]}
+
+    start = time.perf_counter()
+    results, selected = asyncio.run(run_adaptive_probes(targets, 'tcp', k, 2, samples, concurrency,
+                                                        timeout, options))
+    adaptive_time = time.perf_counter() - start
+    adaptive_probes = sum(result.attempts for result in results)
+    adaptive = {result.target.key for result in selected}
+
+    print(f"模拟 {count} 个节点（{dead_ratio:.0%} 不可达），top-{k}，每节点最多 {samples} 次，"
+          f"等待时间缩放 {time_scale}")
+    print(f"   穷举:   {exhaustive_probes:6d} 次探测  {exhaustive_time:6.2f} 秒  "
+          f"与真实top-{k}重合 {len(exhaustive & truth)}/{k}")
+    print(f"   自适应: {adaptive_probes:6d} 次探测  {adaptive_time:6.2f} 秒  "
+          f"与真实top-{k}重合 {len(adaptive & truth)}/{k}  与穷举重合 {len(adaptive & exhaustive)}/{k}")
+    print(f"   探测次数减少 {exhaustive_probes / max(adaptive_probes, 1):.1f} 倍，"
+          f"耗时减少 {exhaustive_time / max(adaptive_time, 1e-6):.1f} 倍")
+
+
+def benchmark_top_k(count=947, k=20, samples=3, concurrency=200, timeout=3.0, dead_ratio=0.3, seed=1):
+    """用模拟延迟对比完整探测与提前结束的top-K探测的耗时与探测次数
+
+    模拟探测按真实时长等待，因此超时节点会像实际网络中一样拖慢完整探测
+    """
+    targets, profiles, simulated_probe = simulate_nodes(count, dead_ratio, 1.0, seed)
+    options = {'probe': simulated_probe}
+
+    start = time.perf_counter()
+    results = asyncio.run(run_probes(targets, 'tcp', samples, concurrency, timeout, options))
+    full_time = time.perf_counter() - start
+    full_probes = sum(result.attempts for result in results)
+    full = [f"{node['address']}:{node['port']}" for node in sort_results(results)[:k]]
+
+    start = time.perf_counter()
+    results, winners, cancelled = asyncio.run(run_top_k_probes(targets, 'tcp', k, None, samples,
+                                                               concurrency, timeout, options))
+    top_k_time = time.perf_counter() - start
+    top_k_probes = sum(result.attempts for result in results)
+    top_k = [result.target.key for result, _ in winners]
+
+    print(f"模拟 {count} 个节点（{dead_ratio:.0%} 不可达），top-{k}，每节点 {samples} 次，超时 {timeout}s")
+    print(f"   完整探测:  {full_probes:6d} 次探测  {full_time:6.2f} 秒")
+    print(f"   top-K探测: {top_k_probes:6d} 次探测  {top_k_time:6.2f} 秒  取消 {cancelled} 个节点  "
+          f"与完整探测的top-{k}重合 {len(set(top_k) & set(full))}/{k}")
+    print(f"   耗时减少 {full_time / max(top_k_time, 1e-6):.1f} 倍")
+
+
+def _tls_listener_process(conn, certfile, keyfile, count):
+    """基准测试用的本地TLS监听进程：握手完成后立即关闭连接，把端口列表发回父进程"""
+
+    async def handle(reader, writer):
+        writer.close()
+
+    async def run():
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        servers = []
+        for _ in range(count):
+            servers.append(await asyncio.start_server(handle, '127.0.0.1', 0, ssl=context, backlog=4096))
+        conn.send([server.sockets[0].getsockname()[1] for server in servers])
+        # 等待父进程通知退出
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+
+    asyncio.run(run())
+
+
+def benchmark_workers(count=3000, worker_counts=(1, 2, 4), concurrency=200, timeout=10.0,
+                      listener_processes=None):
+    """对本地TLS监听端口做握手探测，比较单进程与多进程分片的吞吐量
+
+    监听端同样消耗CPU，默认占用一半的核；需要openssl命令生成临时证书
+    """
+    cpu_count = os.cpu_count() or 1
+    listener_processes = listener_processes or max(1, cpu_count // 2)
+    with tempfile.TemporaryDirectory() as directory:
+        certfile = os.path.join(directory, 'cert.pem')
+        keyfile = os.path.join(directory, 'key.pem')
+        try:
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt',
+                            'ec_paramgen_curve:prime256v1', '-nodes', '-keyout', keyfile,
+                            '-out', certfile, '-days', '1', '-subj', '/CN=localhost'],
+                           check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"❌ 无法用openssl生成临时证书: {e}")
+            return
+
+        listeners = []
+        ports = []
+        for _ in range(listener_processes):
+            receiver, sender = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_tls_listener_process,
+                                              args=(sender, certfile, keyfile, 4), daemon=True)
+            process.start()
+            ports.extend(receiver.recv())
+            listeners.append((process, receiver))
+
+        targets = [parse_node_line(f"vless://bench@127.0.0.1:{ports[index % len(ports)]}"
+                                   f"?security=tls&sni=localhost#bench{index}")
+                   for index in range(count)]
+        print(f"本地TLS握手基准: {count} 次握手，{len(ports)} 个监听端口（{listener_processes} 个进程），"
+              f"CPU核数 {cpu_count}，每进程并发 {concurrency}")
+        try:
+            start = time.perf_counter()
+            results = asyncio.run(run_probes(targets, 'tls', 1, concurrency, timeout))
+            elapsed = time.perf_counter() - start
+            ok = sum(result.successes for result in results)
+            print(f"   单事件循环:    {ok:6d} 成功  {elapsed:6.2f} 秒  {ok / elapsed:8.0f} 次/秒")
+            baseline = ok / elapsed
+            for workers in worker_counts:
+                start = time.perf_counter()
+                results = run_sharded_probes(targets, workers, 'tls', 1, concurrency, timeout)
+                elapsed = time.perf_counter() - start
+                ok = sum(result.successes for result in results)
+                print(f"   {workers:2d} 个进程:     {ok:6d} 成功  {elapsed:6.2f} 秒  "
+                      f"{ok / elapsed:8.0f} 次/秒  ({ok / elapsed / baseline:.2f}x)")
+        finally:
+            for process, conn in listeners:
+                conn.send(None)
+                process.join(5)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="节点延迟探测")
+    parser.add_argument('node_file', nargs='?', help="节点文件路径，如 YXNode、HK900")
+    parser.add_argument('-o', '--output', help="结果JSON路径，默认 probe_<文件名>.json")
+    parser.add_argument('-m', '--mode', choices=sorted(PROBE_MODES), default='tcp', help="探测方式")
+    parser.add_argument('-n', '--samples', type=int, default=3, help="每个节点的样本数")
+    parser.add_argument('-c', '--concurrency', type=int, default=200, help="最大并发数")
+    parser.add_argument('-t', '--timeout', type=float, default=3.0, help="单次探测超时（秒）")
+    parser.add_argument('--verify', action='store_true', help="TLS探测时校验服务器证书")
+    parser.add_argument('--stability', action='store_true',
+                        help="稳定性模式：-n 轮样本分布在 --window 秒内，计算抖动与失败率")
+    parser.add_argument('--window', type=float, default=60.0, help="稳定性模式的时间窗口（秒）")
+    parser.add_argument('--jitter-weight', type=float, default=2.0, help="稳定性得分中抖动的权重")
+    parser.add_argument('--sorted-output', help="按排名重新输出节点文件的路径")
+    parser.add_argument('--drop-failed', action='store_true', help="重新输出节点文件时去掉不可达节点")
+    parser.add_argument('--adaptive', type=int, metavar='K',
+                        help="自适应模式：只为排名不确定的节点追加样本，选出最好的K个（-n 为每节点上限）")
+    parser.add_argument('--top-k', type=int, metavar='K',
+                        help="提前结束模式：选出K个节点后取消不可能更好的剩余探测")
+    parser.add_argument('--threshold', type=float, metavar='MS',
+                        help="--top-k 模式下入选节点的延迟上限（毫秒）")
+    parser.add_argument('--benchmark-top-k', action='store_true',
+                        help="用模拟节点对比完整探测与提前结束的top-K探测")
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="把节点分片到N个子进程探测，每个进程使用 -c 的并发上限（仅普通模式）")
+    parser.add_argument('--benchmark-workers', action='store_true',
+                        help="对本地TLS监听端口比较单进程与多进程分片的握手吞吐量")
+    parser.add_argument('--benchmark-adaptive', action='store_true',
+                        help="用模拟节点对比穷举探测与自适应探测")
+    parser.add_argument('--rate', type=float, help="全局限速：每秒最多发起的探测数")
+    parser.add_argument('--burst', type=int, help="全局限速允许的突发数，默认为速率的1/10")
+    parser.add_argument('--subnet-rate', type=float, help="每个/24网段（IPv6为/48）每秒最多发起的探测数")
+    parser.add_argument('--subnet-burst', type=int, help="网段限速允许的突发数，默认为速率的1/10")
+    parser.add_argument('--report-interval', type=float, default=5.0,
+                        help="限速时每隔N秒输出实际探测速率，0为不输出")
+    parser.add_argument('--history', help="把所有样本计入SQLite延迟历史库（如 v_node/latency_history.db）")
+    parser.add_argument('--history-raw', action='store_true', help="同时在历史库中保留原始样本")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.workers > 1 and (args.stability or args.adaptive or args.top_k):
+        parser.error("--workers 只支持普通模式，不能与 --stability、--adaptive、--top-k 同时使用")
+    if args.benchmark_adaptive:
+        benchmark_adaptive(k=args.adaptive or 20, samples=args.samples, concurrency=args.concurrency)
+        return 0
+    if args.benchmark_workers:
+        benchmark_workers(worker_counts=sorted({1, 2, 4, args.workers}), concurrency=args.concurrency)
+        return 0
+    if args.benchmark_top_k:
+        benchmark_top_k(k=args.top_k or 20, samples=args.samples, concurrency=args.concurrency,
+                        timeout=args.timeout)
+        return 0
+    if not args.node_file:
+        print("❌ 需要指定节点文件")
+        return 1
+    output_file = args.output or f"probe_{os.path.basename(args.node_file)}.json"
+
+    targets = read_node_file(args.node_file)
+    if not targets:
+        print(f"❌ 未从 {args.node_file} 解析到任何节点")
+        return 1
+
+    print(f"探测 {len(targets)} 个节点: 方式 {args.mode}，每节点 {args.samples} 次，"
+          f"并发 {args.concurrency}，超时 {args.timeout}s")
+    start = time.perf_counter()
+    options = {'verify': args.verify}
+    pacer = None
+    if args.rate or args.subnet_rate:
+        pacer = options['pacer'] = ProbePacer(args.rate, args.burst, args.subnet_rate,
+                                              args.subnet_burst, args.report_interval)
+        print(f"限速: 全局 {args.rate or '不限'} 次/秒，每网段 {args.subnet_rate or '不限'} 次/秒")
+    if args.history:
+        options['recorder'] = []
+    selected = None
+    cancelled = 0
+    if args.stability:
+        print(f"稳定性模式: {args.samples} 轮样本分布在 {args.window} 秒内")
+        results = asyncio.run(run_stability_probes(targets, args.mode, args.samples, args.window,
+                                                   args.concurrency, args.timeout, options))
+    elif args.adaptive:
+        print(f"自适应模式: 选出最好的 {args.adaptive} 个节点")
+        results, selected = asyncio.run(run_adaptive_probes(targets, args.mode, args.adaptive,
+                                                            max_samples=args.samples,
+                                                            concurrency=args.concurrency,
+                                                            timeout=args.timeout, options=options))
+    elif args.top_k:
+        threshold = f"，延迟上限 {args.threshold} ms" if args.threshold is not None else ""
+        print(f"top-K模式: 选出最好的 {args.top_k} 个节点{threshold}")
+        results, winners, cancelled = asyncio.run(run_top_k_probes(
+            targets, args.mode, args.top_k, args.threshold, args.samples,
+            args.concurrency, args.timeout, options))
+        selected = [result for result, _ in winners]
+    elif args.workers > 1:
+        print(f"多进程模式: {args.workers} 个进程，每进程并发 {args.concurrency}")
+        results = run_sharded_probes(targets, args.workers, args.mode, args.samples,
+                                     args.concurrency, args.timeout, options)
+    else:
+        results = asyncio.run(run_probes(targets, args.mode, args.samples,
+                                         args.concurrency, args.timeout, options))
+    elapsed = time.perf_counter() - start
+
+    nodes = sort_results(results, args.stability, args.jitter_weight)
+    probes = sum(result.attempts for result in results)
+    if selected is not None:
+        # 入选节点按估计延迟排在最前面
+        rank = {result.target.key: index for index, result in enumerate(selected)}
+        nodes.sort(key=lambda node: rank.get(f"{node['address']}:{node['port']}", len(rank)))
+    reachable = sum(1 for node in nodes if node['ok'])
+    report = {
+        'file': args.node_file,
+        'mode': args.mode,
+        'stability': args.stability,
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'samples': args.samples,
+        'timeout': args.timeout,
+        'elapsed_s': round(elapsed, 3),
+        'probes': probes,
+        'total': len(nodes),
+        'reachable': reachable,
+        'nodes': nodes
+    }
+    if pacer is not None:
+        report['pacing'] = {
+            'rate': args.rate,
+            'subnet_rate': args.subnet_rate,
+            'achieved_rate': round(pacer.achieved_rate(), 1) if args.workers <= 1 else None
+        }
+    if args.adaptive and selected is not None:
+        report['adaptive'] = {
+            'k': args.adaptive,
+            'selected': [result.target.key for result in selected],
+            'exhaustive_probes': len(targets) * args.samples
+        }
+    elif args.top_k:
+        report['top_k'] = {
+            'k': args.top_k,
+            'threshold_ms': args.threshold,
+            'selected': [result.target.key for result in selected],
+            'cancelled': cancelled
+        }
+    write_report(report, output_file)
+
+    print(f"✅ 完成: {reachable}/{len(nodes)} 个节点可达，{probes} 次探测，耗时 {elapsed:.2f} 秒")
+    if pacer is not None and args.workers <= 1:
+        print(f"   平均探测速率 {pacer.achieved_rate():.0f} 次/秒")
+    if args.top_k:
+        print(f"   入选 {len(selected)} 个节点，提前取消了 {cancelled} 个节点的剩余探测")
+    elif selected is not None:
+        print(f"   自适应模式节省了 {len(targets) * args.samples - probes} 次探测"
+              f"（穷举需 {len(targets) * args.samples} 次）")
+    for node in nodes[:10]:
+        if node['ok']:
+            extra = ""
+            if args.stability:
+                extra = f"  抖动 {node['jitter_ms']:.2f} ms  失败率 {node['failure_rate']:.0%}"
+            print(f"   {node['median_ms']:8.2f} ms{extra}  {node['address']}:{node['port']}  {node['name']}")
+    print(f"结果已写入: {output_file}")
+    if args.history:
+        with LatencyHistory(args.history, keep_samples=args.history_raw) as history:
+            count = history.record_many(options['recorder'])
+        print(f"已记录 {count} 个样本到历史库: {args.history}")
+    if args.sorted_output:
+        write_sorted_node_file(nodes, targets, args.sorted_output, args.drop_failed)
+        print(f"排序后的节点文件: {args.sorted_output}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,111 @@
+"""
+探测限速
+同时发起成千上万个连接会占满本机上行带宽和conntrack表，反过来抬高所有节点的延迟。
+这里用令牌桶（GCRA实现）同时限制全局速率和每个 /24 网段（IPv6为 /48）的速率，
+并定期输出实际达到的每秒探测数
+"""
+
+import asyncio
+import ipaddress
+import time
+
+
+class TokenBucket:
+    """令牌桶：平均每秒rate个令牌，最多允许连续burst个
+
+    用理论到达时间（GCRA）实现，不需要定时补充令牌，也不需要锁（只在单个事件循环中使用）
+    """
+    __slots__ = ('interval', 'tolerance', 'tat')
+
+    def __init__(self, rate, burst=1):
+        self.interval = 1.0 / rate
+        self.tolerance = self.interval * max(burst - 1, 0)
+        self.tat = 0.0
+
+    def reserve(self, at):
+        """预约一个不早于at时刻的令牌，返回可以使用它的时刻"""
+        tat = max(self.tat, at)
+        self.tat = tat + self.interval
+        return max(at, tat - self.tolerance)
+
+
+def subnet_key(address):
+    """IPv4按/24、IPv6按/48归组；域名按自身归组"""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address
+    prefix = 24 if ip.version == 4 else 48
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+class ProbePacer:
+    """全局与按网段的探测限速器
+
+    rate / subnet_rate 为每秒探测数，None表示不限制；burst默认为速率的1/10（至少1）
+    report_interval秒输出一次实际速率，0表示不输出
+    """
+
+    def __init__(self, rate=None, burst=None, subnet_rate=None, subnet_burst=None, report_interval=5.0):
+        self.rate = rate
+        self.burst = (burst or max(1, round(rate / 10))) if rate else None
+        self.subnet_rate = subnet_rate
+        self.subnet_burst = (subnet_burst or max(1, round(subnet_rate / 10))) if subnet_rate else None
+        self.report_interval = report_interval
+        self.bucket = TokenBucket(rate, self.burst) if rate else None
+        self.subnets = {}
+        self.subnet_keys = {}
+        self.issued = 0
+        self.started_at = None
+        self.window_start = None
+        self.window_issued = 0
+
+    def split(self, parts):
+        """平分速率，用于多进程探测时每个进程各持有一份"""
+        def share(value):
+            return value / parts if value else None
+
+        def share_burst(value):
+            return max(1, round(value / parts)) if value else None
+
+        return ProbePacer(share(self.rate), share_burst(self.burst), share(self.subnet_rate),
+                          share_burst(self.subnet_burst), self.report_interval)
+
+    def _subnet_bucket(self, address):
+        key = self.subnet_keys.get(address)
+        if key is None:
+            key = self.subnet_keys[address] = subnet_key(address)
+        bucket = self.subnets.get(key)
+        if bucket is None:
+            bucket = self.subnets[key] = TokenBucket(self.subnet_rate, self.subnet_burst)
+        return bucket
+
+    async def acquire(self, target):
+        """等待直到网段和全局速率都允许对target发起一次探测"""
+        now = time.monotonic()
+        at = now
+        if self.subnet_rate:
+            at = self._subnet_bucket(target.address).reserve(at)
+        if self.bucket is not None:
+            at = self.bucket.reserve(at)
+        if at > now:
+            await asyncio.sleep(at - now)
+        self._count()
+
+    def _count(self):
+        now = time.monotonic()
+        if self.started_at is None:
+            self.started_at = self.window_start = now
+        self.issued += 1
+        if self.report_interval and now - self.window_start >= self.report_interval:
+            achieved = (self.issued - self.window_issued) / (now - self.window_start)
+            print(f"   已发起 {self.issued} 次探测，最近 {achieved:.0f} 次/秒")
+            self.window_start = now
+            self.window_issued = self.issued
+
+    def achieved_rate(self):
+        """从第一次探测到现在的平均每秒探测数"""
+        if self.started_at is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started_at
+        return self.issued / elapsed if elapsed > 0 else 0.0
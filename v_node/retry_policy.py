@@ -0,0 +1,83 @@
+"""
+请求重试策略
+指数退避 + 随机抖动，所有数据源共享同一个总时限
+"""
+
+import copy
+import http.client
+import json
+import random
+import socket
+import time
+import urllib.error
+
+
+class RetryPolicy:
+    """带总时限的指数退避重试策略
+
+    同一次运行中的所有请求共享一个 deadline，保证整体耗时有上限；
+    超时、5xx/429、响应被截断（JSON解析或解码失败）视为可重试，其余4xx和配置错误立即放弃。
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0,
+                 jitter=0.5, total_budget=120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.total_budget = total_budget
+        self.deadline = time.monotonic() + total_budget
+
+    @classmethod
+    def from_config(cls, retry_config):
+        """从配置字典创建策略"""
+        return cls(
+            max_attempts=retry_config.get('max_attempts', 4),
+            base_delay=retry_config.get('base_delay', 1.0),
+            max_delay=retry_config.get('max_delay', 30.0),
+            jitter=retry_config.get('jitter', 0.5),
+            total_budget=retry_config.get('total_budget', 120.0)
+        )
+
+    def limited(self, max_attempts):
+        """返回最多尝试max_attempts次的副本，与原策略共享同一个总时限"""
+        policy = copy.copy(self)
+        policy.max_attempts = max(1, min(self.max_attempts, max_attempts))
+        return policy
+
+    def remaining(self):
+        """距离总时限的剩余秒数"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    def attempt_timeout(self, timeout):
+        """单次请求的超时时间，不超过剩余时限"""
+        return max(0.1, min(timeout, self.remaining()))
+
+    def backoff(self, attempt):
+        """第attempt次失败（从1开始）后的等待时间"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        spread = delay * self.jitter
+        return max(0.0, delay + random.uniform(-spread, spread))
+
+    def is_retryable(self, error):
+        """判断错误是否值得重试"""
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code >= 500 or error.code in (408, 429)
+        if isinstance(error, urllib.error.URLError):
+            return True
+        if isinstance(error, (socket.timeout, TimeoutError, ConnectionError,
+                              http.client.IncompleteRead, http.client.RemoteDisconnected)):
+            return True
+        # 响应被截断导致的JSON解析或解码失败；其他ValueError（如URL无效）属于配置错误，不重试
+        if isinstance(error, (json.JSONDecodeError, UnicodeDecodeError)):
+            return True
+        return False
+
+    def next_delay(self, attempt, error):
+        """返回重试前的等待秒数；不应再重试时返回None"""
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return None
+        delay = self.backoff(attempt)
+        if delay >= self.remaining():
+            return None
+        return delay
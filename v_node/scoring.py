@@ -0,0 +1,123 @@
+"""
+候选IP评分
+从API数据中提取延迟、丢包、速度等数值指标，按可配置权重计算得分，
+用堆选出每个分类得分最好的K个（得分越低越好）
+"""
+
+import heapq
+import math
+
+# 各指标在API数据中可能使用的字段名，按顺序取第一个存在的数值
+DEFAULT_METRIC_FIELDS = {
+    "latency": ["avgLatency", "latency", "delay", "ping"],
+    "loss": ["avgPkgLostRate", "pkgLostRate", "lossRate", "loss"],
+    "speed": ["avgSpeed", "speed", "downloadSpeed"]
+}
+
+# 延迟(ms)越低越好；丢包率为0~1的小数，按百分比放大；速度越高越好，因此权重为负；
+# history 为本地探测的EWMA延迟(ms)；client_history 为Clash客户端url-test的EWMA延迟(ms)，
+# 包含经由代理的完整请求，数值明显更高，因此单独计分且权重较低
+DEFAULT_WEIGHTS = {
+    "latency": 1.0,
+    "loss": 100.0,
+    "speed": -0.01,
+    "history": 1.0,
+    "client_history": 0.3
+}
+
+
+def to_number(value):
+    """把API中的数值或数值字符串（可带%、ms后缀）转换为float，失败返回None
+
+    带%后缀的百分数换算为小数（"5%" -> 0.05），与数值形式的丢包率一致
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        text = value.strip().lower()
+        percent = text.endswith('%')
+        if percent:
+            text = text[:-1].strip()
+        elif text.endswith('ms'):
+            text = text[:-2]
+        try:
+            number = float(text)
+        except ValueError:
+            return None
+        if percent:
+            number /= 100
+    else:
+        return None
+    return number if math.isfinite(number) else None
+
+
+class CandidateScorer:
+    """按权重对候选IP打分"""
+
+    def __init__(self, weights=None, fields=None, histories=None, address_of=None):
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.fields = {name: list(names) for name, names in
+                       (DEFAULT_METRIC_FIELDS if fields is None else fields).items()}
+        # histories: {指标名: {地址: EWMA延迟ms}}；address_of: 从API数据取地址的函数
+        self.histories = {name: history for name, history in (histories or {}).items() if history}
+        self.address_of = address_of
+        # 没有历史记录的地址按该指标的中位数计，避免有历史的地址反而吃亏
+        self.history_defaults = {}
+        for name, history in self.histories.items():
+            values = sorted(history.values())
+            self.history_defaults[name] = values[len(values) // 2]
+
+    @classmethod
+    def from_config(cls, scoring_config, histories=None, address_of=None):
+        """从配置字典创建评分器"""
+        return cls(scoring_config.get('weights'), scoring_config.get('fields'),
+                   histories, address_of)
+
+    def extract_metrics(self, ip_data):
+        """提取存在的数值指标 {指标名: 数值}"""
+        metrics = {}
+        if not isinstance(ip_data, dict):
+            return metrics
+        for name, candidates in self.fields.items():
+            for field in candidates:
+                if field in ip_data:
+                    number = to_number(ip_data[field])
+                    if number is not None:
+                        metrics[name] = number
+                        break
+        if self.histories and self.address_of:
+            address = self.address_of(ip_data)
+            for name, history in self.histories.items():
+                metrics[name] = history.get(address, self.history_defaults[name])
+        return metrics
+
+    def score(self, ip_data):
+        """计算加权得分，没有任何带权重的指标时返回None"""
+        metrics = self.extract_metrics(ip_data)
+        total = 0.0
+        found = False
+        for name, value in metrics.items():
+            weight = self.weights.get(name)
+            if weight:
+                total += weight * value
+                found = True
+        return total if found else None
+
+    def select_top_k(self, items, k):
+        """用堆选出得分最好的k个，返回 [(ip_data, 得分), ...]
+
+        没有指标的候选排在有指标的之后；同分时保持API原有顺序，
+        因此完全没有指标时结果与按位置截取前k个一致
+        """
+        if k <= 0:
+            return []
+        keyed = []
+        for position, ip_data in enumerate(items):
+            if not isinstance(ip_data, dict):
+                continue
+            score = self.score(ip_data)
+            keyed.append((math.inf if score is None else score, position, score, ip_data))
+        best = heapq.nsmallest(k, keyed, key=lambda entry: (entry[0], entry[1]))
+        return [(ip_data, score) for _, _, score, ip_data in best]
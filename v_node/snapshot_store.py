@@ -0,0 +1,76 @@
+"""
+API数据快照存储
+每次成功获取的数据按时间戳保存，保留最近若干份；
+数据源失败时回退到仍在有效期内的最新快照
+"""
+
+import json
+import os
+import re
+import time
+
+
+class SnapshotStore:
+    """按数据源保存带时间戳的快照，保留最近retention份"""
+
+    def __init__(self, directory="v_node/snapshots", retention=5, max_age=172800):
+        self.directory = directory
+        self.retention = retention
+        self.max_age = max_age
+
+    def _pattern(self, source):
+        return re.compile(rf"^{re.escape(source)}-(\d+)\.json$")
+
+    def list_snapshots(self, source):
+        """返回该数据源的快照列表 [(保存时间戳, 路径), ...]，新的在前"""
+        pattern = self._pattern(source)
+        snapshots = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return snapshots
+        for name in names:
+            match = pattern.match(name)
+            if match:
+                saved_at = int(match.group(1)) / 1000
+                snapshots.append((saved_at, os.path.join(self.directory, name)))
+        snapshots.sort(reverse=True)
+        return snapshots
+
+    def save(self, source, data, now=None):
+        """保存快照并清理超出保留数量的旧快照，返回快照路径"""
+        now = time.time() if now is None else now
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{source}-{int(now * 1000)}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source': source, 'saved_at': now, 'data': data}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.prune(source)
+        return path
+
+    def prune(self, source):
+        """只保留最近retention份快照"""
+        for _, path in self.list_snapshots(source)[self.retention:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def latest(self, source, now=None):
+        """返回有效期内最新的快照 (数据, 信息)，没有可用快照时返回 (None, None)
+
+        信息包含 path、saved_at、age 三个字段。损坏的快照会被跳过。
+        """
+        now = time.time() if now is None else now
+        for saved_at, path in self.list_snapshots(source):
+            age = now - saved_at
+            if age > self.max_age:
+                break
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            return snapshot.get('data'), {'path': path, 'saved_at': saved_at, 'age': age}
+        return None, None
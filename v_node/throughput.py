@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+节点下载速度测试
+从节点文件（或probe_nodes.py的结果）取前N个节点，直接连接节点的 address:port，
+以测速URL的域名作为SNI/Host下载，统计持续吞吐量并排名
+
+每个节点使用有限数量的并行连接，达到时间或字节预算即提前结束；
+接收数据使用 recv_into 写入复用的缓冲区，不产生额外拷贝
+
+用法:
+    python v_node/throughput.py HK900 --top 10
+    python v_node/throughput.py HK900 --from-probe probe_HK900.json --top 10 --streams 4
+    python v_node/throughput.py --benchmark
+"""
+
+import argparse
+import json
+import os
+import socket
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from probe_nodes import get_ssl_context, read_node_file, write_report
+
+DEFAULT_URL = "https://speed.cloudflare.com/__down?bytes=200000000"
+BUFFER_SIZE = 256 * 1024
+
+
+class TransferBudget:
+    """一个节点所有并行连接共享的时间/字节预算"""
+
+    def __init__(self, duration, max_bytes):
+        self.deadline = time.perf_counter() + duration
+        self.max_bytes = max_bytes
+        self.total = 0
+        self.first_byte = None
+        self.last_byte = None
+        self._lock = threading.Lock()
+
+    def add(self, count, now):
+        """记录收到的字节，返回是否应继续接收"""
+        with self._lock:
+            if self.first_byte is None:
+                self.first_byte = now
+            self.last_byte = now
+            self.total += count
+            return self.total < self.max_bytes and now < self.deadline
+
+    def exhausted(self):
+        return self.total >= self.max_bytes or time.perf_counter() >= self.deadline
+
+
+def open_stream(address, port, url_parts, timeout):
+    """连接节点并发送测速请求，返回socket"""
+    sock = socket.create_connection((address, port), timeout=timeout)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        if url_parts.scheme == 'https':
+            sock = get_ssl_context(('http/1.1',)).wrap_socket(sock, server_hostname=url_parts.hostname)
+        path = url_parts.path or '/'
+        if url_parts.query:
+            path = f"{path}?{url_parts.query}"
+        sock.sendall((
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {url_parts.netloc}\r\n"
+            "User-Agent: Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36\r\n"
+            "Accept: */*\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+        ).encode('ascii'))
+        return sock
+    except Exception:
+        sock.close()
+        raise
+
+
+def run_stream(address, port, url_parts, budget, timeout):
+    """单个下载连接：读取响应头后把正文持续读入复用缓冲区，直到预算用完"""
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    sock = open_stream(address, port, url_parts, timeout)
+    try:
+        # 读取响应头，头后面多读到的正文同样计入
+        received = 0
+        while True:
+            count = sock.recv_into(view[received:])
+            if not count:
+                raise ConnectionResetError("响应头未完整返回")
+            received += count
+            end = buffer.find(b"\r\n\r\n", 0, received)
+            if end >= 0:
+                break
+            if received >= BUFFER_SIZE:
+                raise ValueError("响应头过长")
+        status_line = bytes(buffer[:buffer.find(b"\r\n")]).decode('latin-1')
+        parts = status_line.split(' ', 2)
+        if len(parts) < 2 or parts[1] != '200':
+            raise ValueError(f"HTTP状态异常: {status_line}")
+        body = received - end - 4
+        if body and not budget.add(body, time.perf_counter()):
+            return
+
+        while not budget.exhausted():
+            count = sock.recv_into(view)
+            if not count:
+                break
+            if not budget.add(count, time.perf_counter()):
+                break
+    finally:
+        sock.close()
+
+
+def measure_node(target, url_parts, streams=4, duration=10.0, max_bytes=100 * 1024 * 1024,
+                 timeout=5.0):
+    """用streams个并行连接测试一个节点，返回结果字典"""
+    budget = TransferBudget(duration, max_bytes)
+    errors = []
+    start = time.perf_counter()
+
+    def worker():
+        try:
+            run_stream(target.address, target.port, url_parts, budget, timeout)
+        except (OSError, ssl.SSLError, ValueError) as e:
+            errors.append(f"{type(e).__name__}: {e}")
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(streams)]
+    for thread in threads:
+        thread.start()
+    # 所有连接共用一个截止时间，卡住的连接再多也只等待一个窗口
+    deadline = time.monotonic() + duration + timeout
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+    result = {
+        'name': target.name,
+        'address': target.address,
+        'port': target.port,
+        'bytes': budget.total,
+        'streams': streams,
+        'ok': budget.total > 0
+    }
+    if budget.first_byte is not None:
+        window = max(budget.last_byte - budget.first_byte, 1e-6)
+        result['ttfb_ms'] = round((budget.first_byte - start) * 1000, 2)
+        result['mbps'] = round(budget.total * 8 / window / 1e6, 2)
+        result['bytes_per_s'] = round(budget.total / window)
+    if errors:
+        result['errors'] = errors[:3]
+    return result
+
+
+def select_targets(node_file, top, probe_file=None):
+    """取前top个节点；提供probe结果时按其中可达节点的顺序选择"""
+    targets = read_node_file(node_file)
+    if probe_file:
+        with open(probe_file, 'r', encoding='utf-8') as f:
+            ranked = [f"{node['address']}:{node['port']}"
+                      for node in json.load(f).get('nodes', []) if node.get('ok')]
+        by_key = {target.key: target for target in targets}
+        targets = [by_key[key] for key in ranked if key in by_key]
+    return targets[:top]
+
+
+def run_throughput(targets, url, streams=4, duration=10.0, max_bytes=100 * 1024 * 1024,
+                   timeout=5.0, parallel_nodes=1):
+    """测试所有目标并按吞吐量降序返回结果
+
+    parallel_nodes>1 时多个节点同时测试，速度更快但会互相争抢带宽
+    """
+    url_parts = urlsplit(url)
+    with ThreadPoolExecutor(max_workers=max(1, parallel_nodes)) as executor:
+        results = list(executor.map(
+            lambda target: measure_node(target, url_parts, streams, duration, max_bytes, timeout),
+            targets))
+    return sorted(results, key=lambda r: -r.get('bytes_per_s', 0))
+
+
+def benchmark_local(total_mb=512, streams=4):
+    """本地回环基准：测试接收路径的吞吐量与CPU开销"""
+    from probe_nodes import ProbeTarget
+
+    chunk = b"\0" * (1024 * 1024)
+    body_size = total_mb * 1024 * 1024
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(64)
+    port = server.getsockname()[1]
+
+    def serve(conn):
+        with conn:
+            try:
+                conn.recv(4096)
+                conn.sendall(f"HTTP/1.1 200 OK\r\nContent-Length: {body_size}\r\n\r\n".encode())
+                sent = 0
+                while sent < body_size:
+                    conn.sendall(chunk)
+                    sent += len(chunk)
+            except OSError:
+                pass
+
+    def accept_loop():
+        while True:
+            try:
+                conn, _ = server.accept()
+            except OSError:
+                return
+            threading.Thread(target=serve, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    target = ProbeTarget('benchmark', '127.0.0.1', port, {}, '')
+    cpu_start = time.process_time()
+    result = measure_node(target, urlsplit(f"http://127.0.0.1:{port}/bench"), streams=streams,
+                          duration=30.0, max_bytes=body_size)
+    cpu = time.process_time() - cpu_start
+    server.close()
+    print(f"本地回环基准: {result['bytes'] / 1024 / 1024:.0f} MB, {streams} 个连接, "
+          f"{result.get('mbps', 0):.0f} Mbps, CPU {cpu:.2f} 秒 "
+          f"(含本地服务端发送开销)")
+    return result
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="节点下载速度测试")
+    parser.add_argument('node_file', nargs='?', help="节点文件路径，如 YXNode、HK900")
+    parser.add_argument('--from-probe', help="probe_nodes.py的结果JSON，按其中的排名选择节点")
+    parser.add_argument('--top', type=int, default=10, help="测试前N个节点")
+    parser.add_argument('--url', default=DEFAULT_URL, help="测速URL")
+    parser.add_argument('--streams', type=int, default=4, help="每个节点的并行连接数")
+    parser.add_argument('--duration', type=float, default=10.0, help="每个节点的时间预算（秒）")
+    parser.add_argument('--max-mb', type=float, default=100, help="每个节点的字节预算（MB）")
+    parser.add_argument('--timeout', type=float, default=5.0, help="连接超时（秒）")
+    parser.add_argument('--parallel-nodes', type=int, default=1, help="同时测试的节点数")
+    parser.add_argument('-o', '--output', help="结果JSON路径，默认 speed_<文件名>.json")
+    parser.add_argument('--benchmark', action='store_true', help="运行本地回环基准")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.benchmark:
+        benchmark_local(streams=args.streams)
+        return 0
+    if not args.node_file:
+        print("❌ 需要指定节点文件")
+        return 1
+
+    targets = select_targets(args.node_file, args.top, args.from_probe)
+    if not targets:
+        print(f"❌ 没有可测试的节点")
+        return 1
+
+    print(f"测速 {len(targets)} 个节点: {args.url}，每节点 {args.streams} 个连接，"
+          f"预算 {args.duration}s / {args.max_mb}MB")
+    start = time.perf_counter()
+    results = run_throughput(targets, args.url, args.streams, args.duration,
+                             int(args.max_mb * 1024 * 1024), args.timeout, args.parallel_nodes)
+    elapsed = time.perf_counter() - start
+
+    output_file = args.output or f"speed_{os.path.basename(args.node_file)}.json"
+    write_report({
+        'file': args.node_file,
+        'url': args.url,
+        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'streams': args.streams,
+        'duration': args.duration,
+        'elapsed_s': round(elapsed, 3),
+        'nodes': results
+    }, output_file)
+
+    print(f"✅ 完成，耗时 {elapsed:.2f} 秒")
+    for index, node in enumerate(results, 1):
+        speed = f"{node['mbps']:8.2f} Mbps" if node.get('mbps') else "    失败     "
+        print(f"   {index:2d}. {speed}  {node['address']}:{node['port']}  {node['name']}")
+    print(f"结果已写入: {output_file}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())